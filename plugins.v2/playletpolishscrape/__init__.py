@@ -1,22 +1,21 @@
+import copy
 import datetime
 import os
 import re
 import pytz
-import filecmp
 import threading
+import weakref
 import concurrent.futures
 
-from PIL import Image
 from pathlib import Path
 from typing import List, Tuple, Dict, Any, Optional
-from xml.dom import minidom
 from requests import RequestException
-from xpinyin import Pinyin
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.schedulers.background import BackgroundScheduler
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
+from sqlalchemy.orm import Session
 
 from app import schemas
 from app.chain.storage import StorageChain
@@ -24,6 +23,8 @@ from app.chain.media import ScrapingConfig, MediaChain
 from app.core.config import settings
 from app.core.metainfo import MetaInfoPath
 from app.core.event import eventmanager, Event
+from app.db import db_query
+from app.db.models.transferhistory import TransferHistory
 from app.db.transferhistory_oper import TransferHistoryOper
 from app.helper.directory import DirectoryHelper
 from app.log import logger
@@ -31,16 +32,46 @@ from app.plugins import _PluginBase
 from app.schemas import TransferInfo, TransferDirectoryConf
 from app.schemas.types import NotificationType, MediaType, StorageSchema, EventType, ScrapingTarget, ScrapingMetadata
 from app.utils.common import retry
-from app.utils.dom import DomUtils
-from app.utils.http import RequestUtils
 from app.utils.system import SystemUtils
 from app.utils.string import StringUtils
 from app.utils.mixins import ConfigReloadMixin
 
+from plugins.playletpolishscrape.artwork import ArtworkCache
+from plugins.playletpolishscrape.compare import FileComparator
+from plugins.playletpolishscrape.dircache import DirCache, DirSnapshot
+from plugins.playletpolishscrape.events import EventQueue
+from plugins.playletpolishscrape.nfo import NfoNode, NfoWriter
+from plugins.playletpolishscrape.normalize import TitleNormalizer, meta_search_tv_name, strip_leading_number, \
+    to_pinyin_with_title
+from plugins.playletpolishscrape.poster import PosterPipeline
+from plugins.playletpolishscrape.storage import backend_for
+from plugins.playletpolishscrape.thumb import ThumbQueue
 
 
+# 保护插件内的共享状态
 lock = threading.Lock()
 
+# 剧集目录下存放分集、合集的子目录名
+_SUB_DIR_NAMES = ('分集', '合集', '合集版', '长篇', '长篇版', '长篇合集', '合集长篇')
+
+
+@db_query
+def _list_transfer_status(db: Session = None, storage: str = None, src_dir: str = None) -> Dict[str, bool]:
+    """
+    一次查询目录下所有源文件的整理状态
+    :param storage: 源存储
+    :param src_dir: 源目录
+    :return: 源文件路径 => 状态，同一文件有多条记录时和get_by_src一样取第一条
+    """
+    query = db.query(TransferHistory.src, TransferHistory.status).filter(
+        TransferHistory.src.startswith(src_dir.rstrip("/") + "/", autoescape=True))
+    if storage:
+        query = query.filter(TransferHistory.src_storage == storage)
+    status = {}
+    for src, src_status in query.order_by(TransferHistory.id).all():
+        status.setdefault(src, src_status)
+    return status
+
 
 class FileMonitorHandler(FileSystemEventHandler):
     """
@@ -53,10 +84,26 @@ class FileMonitorHandler(FileSystemEventHandler):
         self.sync = sync
 
     def on_created(self, event):
-        self.sync.event_handler(event=event, mon_path=self._watch_path, event_path=event.src_path)
+        self.sync.event_handler(event=event, source_dir=self._watch_path, event_path=event.src_path)
 
     def on_moved(self, event):
-        self.sync.event_handler(event=event, mon_path=self._watch_path, event_path=event.dest_path)
+        self.sync.event_handler(event=event, source_dir=self._watch_path, event_path=event.dest_path)
+
+
+class SyncBatch:
+    """
+    一批文件整理时共享的数据
+    """
+
+    def __init__(self):
+        # 识别结果 (剧名, 年份, 季) => 媒体信息
+        self.recognized: Dict[tuple, Any] = {}
+        # 已生成剧集和季NFO、图片的 (剧集目录, 季)
+        self.scraped: set = set()
+        # 已批量查询过整理记录的监控目录，其中的文件不再逐个查询
+        self.checked_dirs: set = set()
+        # 目录内容
+        self.dirs = DirCache()
 
 
 class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
@@ -67,7 +114,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
     # 插件图标
     plugin_icon = "Amule_B.png"
     # 插件版本
-    plugin_version = "3.1.0"
+    plugin_version = "3.2.10"
     # 插件作者
     plugin_author = "hyuan280"
     # 作者主页
@@ -82,7 +129,16 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
     # 私有属性
     _scheduler = None
     _observer = []
-    _thread_pool = None
+    # 视频缩略图队列
+    _thumb_queue: ThumbQueue = None
+    # 整理线程池
+    _worker_pool = None
+    # 目录监控事件队列
+    _event_queue: EventQueue = None
+    # 每部剧一把锁，不同剧并行整理
+    _series_locks = weakref.WeakValueDictionary()
+    # 正在整理的批次，目录监控发现变化时清除其中的目录缓存
+    _batches = weakref.WeakSet()
     _medias = {}
     _timeline = "00:00:10"
     _transferhis = TransferHistoryOper()
@@ -105,6 +161,14 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
     _cron = None
     _interval = 10
     _collection_size = 300
+    _max_workers = 4
+    _settle_seconds = 5
+    _image_quality = 75
+    _image_max_height = 0
+    _poster_pipeline: PosterPipeline = None
+    _nfo_writer: NfoWriter = None
+    _artwork_cache: ArtworkCache = None
+    _normalizer: TitleNormalizer = None
     _storage_type = StorageSchema.Local.value
     _transfer_type = "link"
     _monitor_confs = ""
@@ -115,6 +179,8 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
     _onlyonce = False
     _update = False
     _fixlink = False
+    _fixlink_verify = False
+    _comparator: FileComparator = None
 
     # 存储源目录与目的目录关系
     _dirconf: Dict[str, Optional[Path]] = {}
@@ -122,6 +188,8 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
     _transferconf: Dict[str, Optional[str]] = {}
     # 退出事件
     _event = threading.Event()
+    # 整理线程共用的消息汇总和错误次数缓存的锁
+    _state_lock = threading.Lock()
 
 
     def on_config_changed(self):
@@ -131,10 +199,11 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
         # 清空配置
         self._dirconf = {}
         self._transferconf = {}
-        self._medias = {}
-        self._img_error_cache = {}
+        with self._state_lock:
+            self._medias = {}
+            self._img_error_cache = {}
+            self._name_error_cache = {}
         self._search_error_cache = {}
-        self._name_error_cache = {}
 
         # 读取配置
         if config:
@@ -147,6 +216,10 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
             self._cron = config.get("cron")
             self._interval = config.get("interval") or 10
             self._collection_size = config.get("collection_size") or 300
+            self._max_workers = config.get("max_workers") or 4
+            self._settle_seconds = config.get("settle_seconds") or 5
+            self._image_quality = config.get("image_quality") or 75
+            self._image_max_height = config.get("image_max_height") or 0
             self._storage_type = config.get("storage_type") or StorageSchema.Local.value
             self._transfer_type = config.get("transfer_type") or "link"
             self._monitor_confs = config.get("monitor_confs") or ""
@@ -157,6 +230,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
             self._onlyonce = config.get("onlyonce")
             self._update = config.get("update")
             self._fixlink = config.get("fixlink")
+            self._fixlink_verify = config.get("fixlink_verify")
             if isinstance(self._interval, str):
                 try:
                     self._interval = int(self._interval)
@@ -169,6 +243,30 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                 except Exception as e:
                     logger.error(f"认定为合集的文件大小配置错误：{self._collection_size}")
                     self._collection_size = 300
+            # 数字或字符串都需要校验，小于1时线程池无法创建
+            try:
+                self._max_workers = max(1, int(self._max_workers))
+            except Exception as e:
+                logger.error(f"整理线程数配置错误：{self._max_workers}")
+                self._max_workers = 4
+            if isinstance(self._settle_seconds, str):
+                try:
+                    self._settle_seconds = max(1, int(self._settle_seconds))
+                except Exception as e:
+                    logger.error(f"文件稳定等待时间配置错误：{self._settle_seconds}")
+                    self._settle_seconds = 5
+            try:
+                self._image_quality = min(100, max(1, int(self._image_quality)))
+                self._image_max_height = max(0, int(self._image_max_height))
+            except Exception as e:
+                logger.error(f"图片保存配置错误：{self._image_quality} {self._image_max_height}")
+                self._image_quality = 75
+                self._image_max_height = 0
+        self._poster_pipeline = PosterPipeline(quality=self._image_quality, max_height=self._image_max_height)
+        self._nfo_writer = NfoWriter(str(self.get_data_path()))
+        self._artwork_cache = ArtworkCache(str(self.get_data_path()))
+        self._comparator = FileComparator()
+        self._normalizer = TitleNormalizer(rename_title=self._rename_title, invalid_name=self._invalid_name)
 
         # 停止现有任务
         self.stop_service()
@@ -179,12 +277,21 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
 
         if self._enabled or self._onlyonce:
             # 线程池
-            self._thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=6)
+            self._thumb_queue = ThumbQueue(timeline=self._timeline)
+            self._worker_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers)
+            if self._enabled:
+                # 监控事件等文件写入完成后按剧集分批整理
+                self._event_queue = EventQueue(emit=self.__emit_events, group_key=self.__series_dir,
+                                               settle=self._settle_seconds)
             # 定时服务管理器
             self._scheduler = BackgroundScheduler(timezone=settings.TZ)
             if self._notify:
                 # 追加入库消息统一发送服务
                 self._scheduler.add_job(self.send_msg, trigger='interval', seconds=30)
+            # 每天清理一次图片缓存
+            self._scheduler.add_job(self._artwork_cache.prune, trigger='interval', hours=24,
+                                    next_run_time=datetime.datetime.now(
+                                        tz=pytz.timezone(settings.TZ)) + datetime.timedelta(minutes=1))
             # 读取目录配置
             monitor_confs = self._monitor_confs.split("\n")
             if not monitor_confs:
@@ -272,6 +379,10 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
             "cron": self._cron,
             "interval": self._interval,
             "collection_size": self._collection_size,
+            "max_workers": self._max_workers,
+            "settle_seconds": self._settle_seconds,
+            "image_quality": self._image_quality,
+            "image_max_height": self._image_max_height,
             "storage_type": self._storage_type,
             "transfer_type": self._transfer_type,
             "monitor_confs": self._monitor_confs,
@@ -282,6 +393,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
             "onlyonce": self._onlyonce,
             "update": self._update,
             "fixlink": self._fixlink,
+            "fixlink_verify": self._fixlink_verify,
         })
 
     def __is_check_pass(self, path_str: str) -> bool:
@@ -344,10 +456,18 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
         立即运行一次，根据关键字同步目录中所有文件
         """
         logger.info("开始全量整理 ...")
+        batch = self.__new_batch()
+        # 按剧集目录分组，同一部剧的文件顺序处理，不同剧并行处理
+        groups: Dict[str, List[Tuple[str, str]]] = {}
+        total, skipped = 0, 0
         # 遍历所有监控目录
         for source_dir in self._dirconf.keys():
             if self._event.is_set():
                 return
+            # 一次查出目录下的整理记录，过滤掉已整理的文件
+            transferred = None if self._force else self.__transfer_status(source_dir)
+            if transferred is not None:
+                batch.checked_dirs.add(source_dir)
             # 遍历目录下所有文件
             for file_path in SystemUtils.list_files(Path(source_dir), settings.RMT_MEDIAEXT):
                 if self._event.is_set():
@@ -355,11 +475,123 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
 
                 if self.__is_check_pass(str(file_path)):
                     continue
+                total += 1
+                if transferred and str(file_path) in transferred and not transferred[str(file_path)]:
+                    logger.debug(f"{file_path} 已整理过，跳过")
+                    skipped += 1
+                    continue
                 logger.debug(f"file_path={file_path}")
-                self.__handle_file(is_directory=Path(file_path).is_dir(),
-                                   event_path=str(file_path),
-                                   source_dir=source_dir)
-        logger.info("全量整理完成！")
+                groups.setdefault(self.__series_dir(file_path), []).append((str(file_path), source_dir))
+        logger.info(f"共 {total} 个文件，跳过已整理的 {skipped} 个，剩余文件分为 {len(groups)} 组并行处理")
+        # 同一部剧只识别、刮削一次
+        self.__run_groups(list(groups.values()), batch)
+        if self._event.is_set():
+            return
+        logger.info(f"全量整理完成！共识别 {len(batch.recognized)} 部剧，"
+                    f"读取 {batch.dirs.misses} 个目录，目录缓存命中 {batch.dirs.hits} 次")
+        if self._thumb_queue:
+            logger.info(f"视频缩略图：{self._thumb_queue.stats()}")
+
+    def __new_batch(self) -> SyncBatch:
+        """
+        创建整理批次，登记后目录监控事件可以清除其中的目录缓存
+        """
+        batch = SyncBatch()
+        with lock:
+            self._batches.add(batch)
+        return batch
+
+    def __invalidate_dirs(self, *paths: str):
+        """
+        文件变化后清除各批次中所在目录的缓存
+        """
+        with lock:
+            batches = list(self._batches)
+        for batch in batches:
+            for path in paths:
+                batch.dirs.invalidate(path)
+
+    def __dir_snapshot(self, dir_path, batch: SyncBatch = None) -> DirSnapshot:
+        """
+        读取目录内容，同一批次中每个目录只读取一次
+        """
+        if batch:
+            return batch.dirs.get(dir_path)
+        return DirSnapshot(dir_path)
+
+    def __transfer_status(self, source_dir: str) -> Optional[Dict[str, bool]]:
+        """
+        批量查询监控目录下文件的整理记录
+        :return: 源文件路径 => 状态，查询失败返回None，由各文件单独查询
+        """
+        try:
+            # db_query只在传入db参数或位置参数时注入会话
+            return _list_transfer_status(db=None, storage=self._storage_type, src_dir=source_dir)
+        except Exception as e:
+            logger.warn(f"批量查询整理记录失败，改为逐个文件查询：{source_dir}，信息：{type(e).__name__}: {str(e)}")
+            return None
+
+    @staticmethod
+    def __series_dir(file_path: Path) -> str:
+        """
+        文件所属的剧集目录，分集、合集子目录归到上一级
+        """
+        parent = Path(file_path).parent
+        if parent.name in _SUB_DIR_NAMES:
+            parent = parent.parent
+        return str(parent)
+
+    def __handle_group(self, files: List[Tuple[str, str]], batch: SyncBatch = None):
+        """
+        顺序整理一组文件
+        :param files: [(文件路径, 监控目录)]
+        :param batch: 本批次共享的数据
+        """
+        for event_path, source_dir in files:
+            if self._event.is_set():
+                return
+            self.__handle_file(is_directory=Path(event_path).is_dir(),
+                               event_path=event_path,
+                               source_dir=source_dir,
+                               batch=batch)
+
+    def __run_groups(self, groups: List[List[Tuple[str, str]]], batch: SyncBatch = None):
+        """
+        使用整理线程池并行处理各组文件，等待全部完成
+        """
+        pool = self._worker_pool
+        own_pool = pool is None
+        if own_pool:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers)
+        try:
+            futures = []
+            for group in groups:
+                try:
+                    futures.append(pool.submit(self.__handle_group, group, batch))
+                except RuntimeError:
+                    # 线程池已关闭，插件正在停止
+                    break
+            for future in concurrent.futures.as_completed(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"整理过程发生错误: {e}")
+        finally:
+            if own_pool:
+                pool.shutdown(wait=True)
+
+    def __series_lock(self, key: str) -> threading.Lock:
+        """
+        获取一部剧的锁，同一部剧的文件不能同时整理
+        """
+        with lock:
+            series_lock = self._series_locks.get(key)
+            if series_lock is None:
+                series_lock = threading.Lock()
+                self._series_locks[key] = series_lock
+            return series_lock
 
     def event_handler(self, event, source_dir: str, event_path: str):
         """
@@ -371,6 +603,12 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
         if self._event.is_set():
             return
 
+        # 目录内容有变化，图片等非媒体文件也需要清除缓存
+        if event.event_type == "moved":
+            self.__invalidate_dirs(event.src_path, event_path)
+        else:
+            self.__invalidate_dirs(event_path)
+
         # 回收站的文件不处理
         if (event_path.find("/@Recycle") != -1
                 or event_path.find("/#recycle") != -1
@@ -388,72 +626,44 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
 
         # 文件发生变化
         logger.debug(f"变动类型 {event.event_type} 变动路径 {event_path}")
-        self.__handle_file(is_directory=event.is_directory,
-                           event_path=event_path,
-                           source_dir=source_dir)
-
-    def __check_invalid_name(self, search_str):
-        invalid_names = [r'^\d*月\d*日', '余部C边短剧合集']
-        if self._invalid_name:
-            invalid_names.extend(self._invalid_name.split("\n"))
-
-        for invalid_name in invalid_names:
-            if re.search(invalid_name, search_str):
-                return True
-
-        return False
-
-    def __meta_complement(self, is_directory: bool, media_path: str):
+        if not self._event_queue:
+            self.__handle_file(is_directory=event.is_directory,
+                               event_path=event_path,
+                               source_dir=source_dir)
+            return
+        # 放到事件队列，等文件写入完成，不阻塞目录监控线程
+        if event.event_type == "moved":
+            self._event_queue.discard(event.src_path)
+        self._event_queue.put(event_path, source_dir, event.is_directory)
 
-        def _meta_rename_title(file_meta):
-            if self._rename_title:
-                rename_titles = self._rename_title.split("\n")
-                if not rename_titles:
-                    return file_meta
+    def __emit_events(self, files: List[Tuple[str, str, bool]]):
+        """
+        一部剧写入完成的文件交给整理线程池
+        :param files: [(文件路径, 监控目录, 是否目录)]
+        """
+        if not self._worker_pool:
+            return
+        try:
+            self._worker_pool.submit(self.__handle_group, [(path, source_dir) for path, source_dir, _ in files],
+                                     self.__new_batch())
+        except RuntimeError:
+            logger.debug(f"整理线程池已关闭，不处理：{[path for path, _, _ in files]}")
 
-                for rename_title in rename_titles:
-                    if not '=>' in rename_title:
-                        continue
-                    old_title = rename_title.split('=>')[0].strip()
-                    new_title = rename_title.split('=>')[1].strip().replace('$', ' ').replace('&', ' ').strip()
-                    if StringUtils.is_chinese(new_title):
-                        if file_meta.cn_name and re.search(rf"{old_title}", file_meta.cn_name):
-                            logger.info(f"替换标题：{file_meta.cn_name} => {new_title}")
-
-                            file_meta.cn_name = new_title
-                            file_meta.en_name = to_pinyin_with_title(new_title)
-                            break
-                    else:
-                        if file_meta.en_name and re.search(rf"{old_title}", file_meta.en_name):
-                            logger.info(f"替换标题：{file_meta.en_name} => {new_title}")
-                            file_meta.cn_name = None
-                            file_meta.en_name = old_title
-                            break
-
-            return file_meta
-
-        def _to_chinese_tv_name(title: str) -> str:
-            tv_name = ""
-            for word in re.split(r'[ .\-~·]', title):
-                if StringUtils.is_chinese(word):
-                    tv_name += f"{word} "
-            logger.info(f'chinese_tv_name={tv_name}')
-            return tv_name.strip()
+    def __meta_complement(self, is_directory: bool, media_path: str, batch: SyncBatch = None):
+        normalizer = self._normalizer
 
         _path = Path(media_path)
         tv_path = _path
         file_meta = MetaInfoPath(_path)
         org_title = file_meta.title
-        org_bracket = re.search(r"\d+.*(\(\d+\))", org_title)
-        if org_bracket:
-            org_new = org_title.replace(org_bracket.group(1), "")
+        org_new = normalizer.strip_org_bracket(org_title)
+        if org_new is not None:
             file_meta.org_string = org_new
         org_string = file_meta.org_string
 
-        se_match = re.search(r'S(\d+)E(\d+)', org_string)
+        se_match = normalizer.season_episode(org_string)
         if se_match:
-            file_meta.begin_season = int(se_match.group(1))
-            file_meta.begin_episode = int(se_match.group(2))
+            file_meta.begin_season, file_meta.begin_episode = se_match
 
         logger.info(f"file_meta={file_meta}")
         # 判断是不是合集，使用父目录名和文件大小判断
@@ -461,24 +671,19 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                     or (file_meta.begin_episode is None and _path.is_file() and _path.stat().st_size >= self._collection_size * 1024 * 1024):
             logger.info(f"合集目录，查看父目录是否是电视剧目录：{media_path}")
             parent_dir = _path.parent
-            is_tv = False
-            for file in parent_dir.iterdir():
-                if file.suffix.lower() in settings.RMT_MEDIAEXT:
-                    is_tv = True
-                    break
-            if not is_tv:
+            if not self.__dir_snapshot(parent_dir, batch).has_media:
                 logger.info(f"父目录不是电视剧目录，不处理：{media_path}")
                 return None, tv_path
             tv_path = parent_dir.parent
             tv_name = tv_path.name
-            file_meta = meta_search_tv_name(file_meta, _to_chinese_tv_name(tv_name), True)
+            file_meta = meta_search_tv_name(file_meta, normalizer.chinese_tv_name(tv_name), True)
         elif file_meta.cn_name and file_meta.year:
             pass
-        elif re.search(r'番外(\d*)', org_string):
+        elif normalizer.extra_episode(org_string):
             tv_path = _path.parent
             tv_name = tv_path.name
-            file_meta = meta_search_tv_name(file_meta, _to_chinese_tv_name(tv_name), True)
-            story_match = re.search(r'番外(\d*)', org_string)
+            file_meta = meta_search_tv_name(file_meta, normalizer.chinese_tv_name(tv_name), True)
+            story_match = normalizer.extra_episode(org_string)
             if story_match.group(1):
                 try:
                     ep = int(story_match.group(1))
@@ -488,10 +693,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                     logger.error(f"番外集数获取错误：{org_string}")
                     return None, tv_path
 
-        elif re.search(r'^\d+([.-][0-9a-zA-Z]+)?([.-]\d+)?([集话]|本季完|完结|最终集|大结局)?.?$', org_string) \
-                    or re.search(r'^\d+[.-]([0-9a-zA-Z]+)-.*', org_string) \
-                    or re.search(r'^[0-9a-zA-Z]*$', org_string) \
-                    or self.__check_invalid_name(org_string):
+        elif normalizer.is_episode_name(org_string):
             logger.info(f"文件名符合剧集目录：{org_string}")
             if is_directory:
                 logger.warn(f"单独的数字目录，不处理：{media_path}")
@@ -502,21 +704,17 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
             if tv_name == "分集":
                 tv_path = Path(media_path).parent.parent
                 tv_name = tv_path.name
-            file_meta = meta_search_tv_name(file_meta, _to_chinese_tv_name(tv_name))
+            file_meta = meta_search_tv_name(file_meta, normalizer.chinese_tv_name(tv_name))
         elif file_meta.cn_name:
-            file_meta = meta_search_tv_name(file_meta, _to_chinese_tv_name(org_string))
+            file_meta = meta_search_tv_name(file_meta, normalizer.chinese_tv_name(org_string))
         elif file_meta.name and StringUtils.is_chinese(tv_path.parent.name):
-            file_meta = meta_search_tv_name(file_meta, _to_chinese_tv_name(tv_path.parent.name))
+            file_meta = meta_search_tv_name(file_meta, normalizer.chinese_tv_name(tv_path.parent.name))
 
         file_meta.customization = '短剧'
 
         logger.info(f"begin_episode={file_meta.begin_episode}")
         if file_meta.begin_episode is None:
-            ep_match = re.search(r'^(\d+)\b', org_string) # 集数可能在开头
-            if not ep_match:
-                ep_match = re.search(r'(\d+)$', org_string) # 集数可能在结尾
-            if not ep_match:
-                ep_match = re.search(r'\((\d+)\)', org_string) # 集数可能在括号
+            ep_match = normalizer.episode_number(org_string)
             logger.info(f"ep_match={ep_match}")
             if ep_match:
                 try:
@@ -528,18 +726,41 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                         logger.error(f"文件名获取的集数错误: 集数({file_meta.begin_episode}) > 总集({file_meta.total_episode})")
                         file_meta.begin_episode = None
 
-        return _meta_rename_title(file_meta), str(tv_path)
+        return normalizer.rename_title(file_meta), str(tv_path)
 
-    def __handle_file(self, is_directory: bool, event_path: str, source_dir: str):
+    def __recognize_media(self, file_meta, batch: SyncBatch = None):
+        """
+        识别媒体信息，同一批次中相同剧名、年份、季的文件使用第一次的识别结果
+        :param file_meta: 文件元数据
+        :param batch: 本批次共享的数据，为None时不复用
+        """
+        memo_key = (file_meta.cn_name or file_meta.name, file_meta.year, file_meta.begin_season)
+        if batch and memo_key in batch.recognized:
+            mediainfo = batch.recognized[memo_key]
+            # 整理时会修改媒体信息，每个文件使用一份副本
+            return copy.deepcopy(mediainfo) if mediainfo else None
+
+        with lock:
+            use_cache = not self._update
+            if self._update:
+                self._update = False
+                self.__update_config()
+        mediainfo = self.chain.recognize_media(meta=file_meta, mtype=MediaType.TV, cache=use_cache)
+        if batch:
+            batch.recognized[memo_key] = copy.deepcopy(mediainfo) if mediainfo else None
+        return mediainfo
+
+    def __handle_file(self, is_directory: bool, event_path: str, source_dir: str, batch: SyncBatch = None):
         """
         同步一个文件
         :event.is_directory
         :param event_path: 事件文件路径
         :param source_dir: 监控目录
+        :param batch: 本批次共享的数据
         """
         logger.info(f"开始处理媒体文件：{event_path}")
-        # 整理成功的不再处理
-        if not self._force:
+        # 整理成功的不再处理，全量整理时已批量查询过
+        if not self._force and not (batch and source_dir in batch.checked_dirs):
             transferd = self._transferhis.get_by_src(event_path, storage=self._storage_type)
             if transferd:
                 if not transferd.status:
@@ -552,18 +773,22 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
         logger.debug(f"fileitem：{fileitem}")
 
 
-        with lock:
-            # 元数据
-            try:
-                file_meta, tv_path = self.__meta_complement(is_directory, event_path)
-            except Exception as e:
-                logger.error(f"识别元数据出错：{e}")
-                return None
-            if not file_meta:
-                return
-            logger.debug(f"元数据：{file_meta}")
-            if not file_meta.name:
-                logger.error(f"{Path(event_path).name} 无法识别有效信息")
+        # 元数据
+        try:
+            file_meta, tv_path = self.__meta_complement(is_directory, event_path, batch)
+        except Exception as e:
+            logger.error(f"识别元数据出错：{e}")
+            return None
+        if not file_meta:
+            return
+        logger.debug(f"元数据：{file_meta}")
+        if not file_meta.name:
+            logger.error(f"{Path(event_path).name} 无法识别有效信息")
+            return
+
+        # 识别、整理、刮削只锁同一部剧
+        with self.__series_lock(file_meta.cn_name or file_meta.name):
+            if self._event.is_set():
                 return
 
             # 检查是否有集数
@@ -573,28 +798,14 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                     file_meta.begin_episode = 1
                 else:
                     # 没有集数且目录里只有一个媒体文件，将集数设置为1
-                    if is_directory:
-                        _fileitem = fileitem
-                    else:
-                        _fileitem = self._storagechain.get_file_item(self._storage_type, Path(event_path).parent)
-                    dir_fileitems = self._storagechain.list_files(_fileitem)
-                    _media_num = 0
-                    for fi in dir_fileitems:
-                        if f'.{fi.extension}' in settings.RMT_MEDIAEXT:
-                            _media_num += 1
-                    if _media_num == 1:
+                    media_dir = event_path if is_directory else Path(event_path).parent
+                    if self.__dir_snapshot(media_dir, batch).media_count == 1:
                         file_meta.begin_episode = 1
 
             try:
                 # 从选择的站点识别媒体信息
                 _begin_season = file_meta.begin_season # 识别会将begin_season修改，先保存
-                if self._update:
-                    use_cache = False
-                    self._update = False
-                    self.__update_config()
-                else:
-                    use_cache = True
-                mediainfo = self.chain.recognize_media(meta=file_meta, mtype=MediaType.TV, cache=use_cache)
+                mediainfo = self.__recognize_media(file_meta, batch)
                 if not mediainfo:
                     logger.error(f"未查找到媒体信息")
                     if self._historysave:
@@ -621,7 +832,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                         )
                     return
 
-                if not StringUtils.is_all_chinese(re.sub(r'^\d+[-.]*', '', mediainfo.title)):
+                if not StringUtils.is_all_chinese(strip_leading_number(mediainfo.title)):
                     file_meta = meta_search_tv_name(file_meta, mediainfo.title)
                     mediainfo.title = file_meta.cn_name
                 file_meta.begin_season = _begin_season # 恢复
@@ -633,12 +844,11 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                     mediainfo.season = 0
                 logger.debug(f"媒体信息：{mediainfo}")
 
-                if file_meta.cn_name in self._name_error_cache.keys():
-                    if self._name_error_cache.get(file_meta.cn_name) > self._error_count:
-                        logger.info(f"剧名（{file_meta.cn_name}）搜索错误次数超过{self._error_count}次")
-                        return
-                else:
-                    self._name_error_cache[file_meta.cn_name] = 0
+                with self._state_lock:
+                    name_errors = self._name_error_cache.setdefault(file_meta.cn_name, 0)
+                if name_errors > self._error_count:
+                    logger.info(f"剧名（{file_meta.cn_name}）搜索错误次数超过{self._error_count}次")
+                    return
                 try:
                     # 查询转移目的目录
                     target_dir = DirectoryHelper().get_dir(mediainfo, src_path=Path(source_dir))
@@ -688,9 +898,9 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                         src_file = transferinfo.fileitem.path
                         dest_file = transferinfo.target_item.path
                         temp_file = f"{src_file}.back"
-                        logger.info("媒体库同名文件，检查文件大小 ...")
+                        logger.info("媒体库同名文件，检查文件是否相同 ...")
                         try:
-                            if filecmp.cmp(src_file, dest_file):
+                            if self._comparator.same(src_file, dest_file, full=self._fixlink_verify):
                                 os.rename(src_file, temp_file)
                                 os.link(dest_file, src_file)
                                 os.remove(temp_file)
@@ -735,31 +945,38 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                     logger.error(f"{event_path} 刮削失败, 请重新配置运行插件: {e}")
                     return
 
-                # 查看tv_path路径下是否有jpg文件
-                self.__scrape_metadata(file_meta, transferinfo, mediainfo=mediainfo, img_path=self.__get_dir_image(tv_path))
+                # 剧集和季的NFO、图片每批次只生成一次
+                series_key = (transferinfo.target_diritem.path, mediainfo.season)
+                if not batch or series_key not in batch.scraped:
+                    # 查看tv_path路径下是否有jpg文件
+                    self.__scrape_series(transferinfo, mediainfo=mediainfo, img_path=self.__get_dir_image(tv_path, batch))
+                    if batch:
+                        batch.scraped.add(series_key)
+                self.__scrape_episode(file_meta, transferinfo, mediainfo=mediainfo)
 
-                self._name_error_cache[file_meta.cn_name] = 0
+                with self._state_lock:
+                    self._name_error_cache[file_meta.cn_name] = 0
 
-                if self._notify:
-                    # 发送消息汇总
-                    media_list = self._medias.get(mediainfo.title_year) or {}
-                    if media_list:
-                        media_files = media_list.get("files") or []
-                        if media_files:
-                            if str(event_path) not in media_files:
-                                media_files.append(str(event_path))
+                    if self._notify:
+                        # 发送消息汇总
+                        media_list = self._medias.get(mediainfo.title_year) or {}
+                        if media_list:
+                            media_files = media_list.get("files") or []
+                            if media_files:
+                                if str(event_path) not in media_files:
+                                    media_files.append(str(event_path))
+                            else:
+                                media_files = [str(event_path)]
+                            media_list = {
+                                "files": media_files,
+                                "time": datetime.datetime.now()
+                            }
                         else:
-                            media_files = [str(event_path)]
-                        media_list = {
-                            "files": media_files,
-                            "time": datetime.datetime.now()
-                        }
-                    else:
-                        media_list = {
-                            "files": [str(event_path)],
-                            "time": datetime.datetime.now()
-                        }
-                    self._medias[mediainfo.title_year] = media_list
+                            media_list = {
+                                "files": [str(event_path)],
+                                "time": datetime.datetime.now()
+                            }
+                        self._medias[mediainfo.title_year] = media_list
 
             except Exception as e:
                 self._event.set()
@@ -774,71 +991,55 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
         :param transferinfo: 媒体整理的转移信息
         :param season: 短剧季数
         '''
+        tv_path = transferinfo.target_diritem.path
+        # (刮削选项, 路径, 长宽比, 说明)
+        candidates = []
         backdrop_option = self._scraping_config.option(ScrapingTarget.TV, ScrapingMetadata.BACKDROP)
         if not backdrop_option.is_skip:
-            backdrop_path = f"{transferinfo.target_diritem.path}poster.jpg"
-            if backdrop_option.is_overwrite or not os.path.exists(backdrop_path):
-                logger.debug(f"保存电视剧背景图：{backdrop_path}")
-                self.__save_poster(input_path=thumb_path, poster_path=backdrop_path, cover_conf="2:3")
+            candidates.append((backdrop_option.is_overwrite, f"{tv_path}poster.jpg", "2:3", "电视剧背景图"))
         thumb_option = self._scraping_config.option(ScrapingTarget.TV, ScrapingMetadata.THUMB)
         poster_option = self._scraping_config.option(ScrapingTarget.TV, ScrapingMetadata.POSTER)
         if not thumb_option.is_skip or not poster_option.is_skip:
-            folder_path = f"{transferinfo.target_diritem.path}folder.jpg"
-            if thumb_option.is_overwrite or poster_option.is_overwrite or not os.path.exists(folder_path):
-                logger.debug(f"保存电视剧缩略图：{folder_path}")
-                self.__save_poster(input_path=thumb_path, poster_path=folder_path, cover_conf="2:3")
+            candidates.append((thumb_option.is_overwrite or poster_option.is_overwrite,
+                               f"{tv_path}folder.jpg", "2:3", "电视剧缩略图"))
         banner_option = self._scraping_config.option(ScrapingTarget.TV, ScrapingMetadata.BANNER)
         if not banner_option.is_skip:
-            landscape_path = f"{transferinfo.target_diritem.path}landscape.jpg"
-            if banner_option.is_overwrite or not os.path.exists(landscape_path):
-                logger.debug(f"保存电视剧横幅图：{landscape_path}")
-                self.__save_poster(input_path=thumb_path, poster_path=landscape_path, cover_conf="16:9")
+            candidates.append((banner_option.is_overwrite, f"{tv_path}landscape.jpg", "16:9", "电视剧横幅图"))
         se_poster_option = self._scraping_config.option(ScrapingTarget.SEASON, ScrapingMetadata.POSTER)
         if not se_poster_option.is_skip:
-            poster_path = f"{transferinfo.target_diritem.path}season{season:02d}-poster.jpg"
-            if se_poster_option.is_overwrite or not os.path.exists(poster_path):
-                logger.debug(f"保存季海报：{poster_path}")
-                self.__save_poster(input_path=thumb_path, poster_path=poster_path, cover_conf="2:3")
-        se_thumb_option = self._scraping_config.option(ScrapingTarget.SEASON, ScrapingMetadata.THUMB)
-        if not se_thumb_option.is_skip:
-            episode_video_path = transferinfo.target_item.path
-            _episode_video_path = Path(episode_video_path)
-            episode_thumb_path = _episode_video_path.with_name(_episode_video_path.stem + "-thumb.jpg")
-            if se_thumb_option.is_overwrite or not os.path.exists(episode_thumb_path):
-                logger.debug(f"保存每集图片：{episode_thumb_path}")
-                self.__get_thumb(episode_video_path, episode_thumb_path)
-
-    def __scrape_metadata(self, file_meta, transferinfo, mediainfo, img_path: str = None):
+            candidates.append((se_poster_option.is_overwrite, f"{tv_path}season{season:02d}-poster.jpg", "2:3", "季海报"))
+        # 一次检查所有图片是否存在，网络挂载时只列一次目录
+        exists = backend_for(tv_path).exists_many(path for overwrite, path, _, _ in candidates if not overwrite)
+        # 需要保存的图片和长宽比，源图片只解码一次
+        targets = []
+        for overwrite, path, cover_conf, desc in candidates:
+            if overwrite or not exists.get(path):
+                logger.debug(f"保存{desc}：{path}")
+                targets.append((path, cover_conf))
+        self._poster_pipeline.render(thumb_path, targets)
+
+    def __scrape_series(self, transferinfo, mediainfo, img_path: str = None):
         '''
-        从站点刮削图片
-        :param file_meta: 文件元数据
-        :param transferinfo:媒体整理的转移信息
+        刮削剧集和季的NFO、图片，同一部剧每批次只需要执行一次
+        :param transferinfo: 媒体整理的转移信息
         :param mediainfo: 媒体元数据
+        :param img_path: 源目录中的图片
         '''
         tv_path = transferinfo.target_diritem.path
-        ep_path = transferinfo.target_item.path
-        se_path = os.path.dirname(ep_path)
-        name = transferinfo.target_item.basename
-        match = re.search(r'S(\d{2})E(\d{2,})', name)
-        if match:
-            episode = int(match.group(2))
-        else:
-            episode = -1
+        se_path = os.path.dirname(transferinfo.target_item.path)
+        # 一次检查NFO是否存在，网络挂载时同一目录只列一次
+        exists = backend_for(tv_path).exists_many([f"{tv_path}/tvshow.nfo", f"{se_path}/season.nfo"])
 
         try:
             tv_option = self._scraping_config.option(ScrapingTarget.TV, ScrapingMetadata.NFO)
             if not tv_option.is_skip:
-                if tv_option.is_overwrite or not os.path.exists(f"{tv_path}/tvshow.nfo"):
+                if tv_option.is_overwrite or not exists[f"{tv_path}/tvshow.nfo"]:
                     tags = mediainfo.tagline.split() if mediainfo.tagline else []
                     self.__gen_tv_nfo_file(Path(tv_path), mediainfo.title, mediainfo.year, mediainfo.overview, mediainfo.release_date, tags, mediainfo.actors)
             se_option = self._scraping_config.option(ScrapingTarget.SEASON, ScrapingMetadata.NFO)
             if not se_option.is_skip:
-                if se_option.is_overwrite or not os.path.exists(f"{se_path}/season.nfo"):
+                if se_option.is_overwrite or not exists[f"{se_path}/season.nfo"]:
                     self.__gen_se_nfo_file(Path(se_path), mediainfo.season, mediainfo.year, mediainfo.overview, mediainfo.release_date, mediainfo.actors)
-            ep_option = self._scraping_config.option(ScrapingTarget.EPISODE, ScrapingMetadata.NFO)
-            if not ep_option.is_skip and os.path.isfile(ep_path):
-                if ep_option.is_overwrite or not os.path.exists(f"{se_path}/{name}.nfo"):
-                    self.__gen_ep_nfo_file(Path(se_path), name, mediainfo.season, episode, mediainfo.year, date=mediainfo.release_date, end_episode=file_meta.end_episode)
         except Exception as e:
             logger.error(f"刮削nfo文件失败：{e}")
             raise e
@@ -854,7 +1055,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
             thumb_path = Path(img_path)
         else:
             thumb_path = file_path.with_name(file_path.stem + "-site.jpg")
-        if thumb_path.exists():
+        if backend_for(thumb_path).stat(thumb_path):
             logger.debug(f"图片已存在/下载：{thumb_path}")
             self.__scrape_all_img(thumb_path, transferinfo, mediainfo.season)
         else:
@@ -864,48 +1065,42 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
             except RequestException as e:
                 logger.error(f"下载图片失败：{e}")
 
-    def __save_poster(self, input_path, poster_path, cover_conf):
-        """
-        截取图片做封面
-        """
-        try:
-            image = Image.open(input_path)
-
-            # 需要截取的长宽比（比如 16:9）
-            if not cover_conf:
-                target_ratio = 2 / 3
-            else:
-                covers = cover_conf.split(":")
-                target_ratio = int(covers[0]) / int(covers[1])
-
-            # 获取原始图片的长宽比
-            original_ratio = image.width / image.height
-
-            # 计算截取后的大小
-            if original_ratio > target_ratio:
-                new_height = image.height
-                new_width = int(new_height * target_ratio)
-            else:
-                new_width = image.width
-                new_height = int(new_width / target_ratio)
-
-            # 计算截取的位置
-            # 如果截取后的高度小于原图的一半，从图片的下半部分截取
-            if new_height < image.height / 2:
-                top = image.height // 2
-            else:
-                top = (image.height - new_height) // 2
-            left = (image.width - new_width) // 2
-            right = left + new_width
-            bottom = top + new_height
+    def __scrape_episode(self, file_meta, transferinfo, mediainfo):
+        '''
+        刮削每集的NFO和缩略图
+        :param file_meta: 文件元数据
+        :param transferinfo:媒体整理的转移信息
+        :param mediainfo: 媒体元数据
+        '''
+        ep_path = transferinfo.target_item.path
+        se_path = os.path.dirname(ep_path)
+        name = transferinfo.target_item.basename
+        match = re.search(r'S(\d{2})E(\d{2,})', name)
+        if match:
+            episode = int(match.group(2))
+        else:
+            episode = -1
 
-            # 截取图片
-            cropped_image = image.crop((left, top, right, bottom))
+        _episode_video_path = Path(ep_path)
+        episode_thumb_path = _episode_video_path.with_name(_episode_video_path.stem + "-thumb.jpg")
+        # 视频、NFO和缩略图在同一目录，网络挂载时只列一次目录
+        stats = backend_for(se_path).stat_many([ep_path, f"{se_path}/{name}.nfo", episode_thumb_path])
 
-            # 保存截取后的图片
-            cropped_image.save(poster_path)
+        try:
+            ep_option = self._scraping_config.option(ScrapingTarget.EPISODE, ScrapingMetadata.NFO)
+            ep_stat = stats[ep_path]
+            if not ep_option.is_skip and ep_stat and ep_stat.is_file:
+                if ep_option.is_overwrite or not stats[f"{se_path}/{name}.nfo"]:
+                    self.__gen_ep_nfo_file(Path(se_path), name, mediainfo.season, episode, mediainfo.year, date=mediainfo.release_date, end_episode=file_meta.end_episode)
         except Exception as e:
-            print(str(e))
+            logger.error(f"刮削nfo文件失败：{e}")
+            raise e
+
+        se_thumb_option = self._scraping_config.option(ScrapingTarget.SEASON, ScrapingMetadata.THUMB)
+        if not se_thumb_option.is_skip:
+            if se_thumb_option.is_overwrite or not stats[str(episode_thumb_path)]:
+                logger.debug(f"保存每集图片：{episode_thumb_path}")
+                self.__get_thumb(ep_path, episode_thumb_path)
 
     def __gen_tv_nfo_file(self, dir_path: Path, title: str, year: str, plot: str = None, date: str = None, tags: list = [], actors: dict = None):
         """
@@ -920,38 +1115,34 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
         """
         # 开始生成XML
         logger.info(f"正在生成电视剧总季NFO文件：{dir_path.name}")
-        doc = minidom.Document()
-        root = DomUtils.add_node(doc, doc, "tvshow")
-
-        current_time = datetime.datetime.now()
-        formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
+        root = NfoNode("tvshow")
 
         #介绍
         if plot:
-            DomUtils.add_node(doc, root, "plot", plot)
-            DomUtils.add_node(doc, root, "outline", plot)
+            root.add("plot", plot)
+            root.add("outline", plot)
         #日期
         if date:
-            DomUtils.add_node(doc, root, "premiered", date)
-            DomUtils.add_node(doc, root, "releasedate", date)
+            root.add("premiered", date)
+            root.add("releasedate", date)
         # 标题
-        DomUtils.add_node(doc, root, "dateadded", formatted_time)
-        DomUtils.add_node(doc, root, "title", title)
-        DomUtils.add_node(doc, root, "originaltitle", title)
-        DomUtils.add_node(doc, root, "year", year)
+        root.add_dateadded()
+        root.add("title", title)
+        root.add("originaltitle", title)
+        root.add("year", year)
         if tags:
             for _t in tags:
-                DomUtils.add_node(doc, root, "tag", _t)
+                root.add("tag", _t)
         if actors:
-            actor = DomUtils.add_node(doc, root, "actor")
+            actor = root.add("actor")
             for _a in actors:
-                    DomUtils.add_node(doc, actor, "name", _a.get('name'))
-                    DomUtils.add_node(doc, actor, "type", _a.get('type'))
+                    actor.add("name", _a.get('name'))
+                    actor.add("type", _a.get('type'))
 
-        DomUtils.add_node(doc, root, "season", "-1")
-        DomUtils.add_node(doc, root, "episode", "-1")
+        root.add("season", "-1")
+        root.add("episode", "-1")
         # 保存
-        self.__save_nfo(doc, dir_path.joinpath("tvshow.nfo"))
+        self.__save_nfo(root, dir_path.joinpath("tvshow.nfo"))
 
     def __gen_se_nfo_file(self, dir_path: Path, season: int, year: str, plot: str = None, date: str = None, actors: dict = None):
         """
@@ -965,32 +1156,28 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
         """
         # 开始生成XML
         logger.info(f"正在生成电视剧季NFO文件：{dir_path.name}")
-        doc = minidom.Document()
-        root = DomUtils.add_node(doc, doc, "season")
-
-        current_time = datetime.datetime.now()
-        formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
+        root = NfoNode("season")
 
         #介绍
         if plot:
-            DomUtils.add_node(doc, root, "plot", plot)
-            DomUtils.add_node(doc, root, "outline", plot)
+            root.add("plot", plot)
+            root.add("outline", plot)
         #日期
         if date:
-            DomUtils.add_node(doc, root, "premiered", date)
-            DomUtils.add_node(doc, root, "releasedate", date)
+            root.add("premiered", date)
+            root.add("releasedate", date)
         # 标题
-        DomUtils.add_node(doc, root, "dateadded", formatted_time)
-        DomUtils.add_node(doc, root, "title", f"第 {season} 季")
-        DomUtils.add_node(doc, root, "year", year)
-        DomUtils.add_node(doc, root, "seasonnumber", season)
+        root.add_dateadded()
+        root.add("title", f"第 {season} 季")
+        root.add("year", year)
+        root.add("seasonnumber", season)
         if actors:
-            actor = DomUtils.add_node(doc, root, "actor")
+            actor = root.add("actor")
             for _a in actors:
-                    DomUtils.add_node(doc, actor, "name", _a.get('name'))
-                    DomUtils.add_node(doc, actor, "type", _a.get('type'))
+                    actor.add("name", _a.get('name'))
+                    actor.add("type", _a.get('type'))
         # 保存
-        self.__save_nfo(doc, dir_path.joinpath("season.nfo"))
+        self.__save_nfo(root, dir_path.joinpath("season.nfo"))
 
     def __gen_ep_nfo_file(self, dir_path: Path, name: str, season: int, episode: int, year: str, plot: str = None, date: str = None, end_episode: int = None):
         """
@@ -1005,148 +1192,124 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
         :param end_episode: 电视剧多集整合的最后集数
         """
         # 开始生成XML
-        doc = minidom.Document()
-        root = DomUtils.add_node(doc, doc, "episodedetails")
-
-        current_time = datetime.datetime.now()
-        formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
+        root = NfoNode("episodedetails")
 
         #介绍
         if plot:
-            DomUtils.add_node(doc, root, "plot", plot)
+            root.add("plot", plot)
         #日期
         if date:
-            DomUtils.add_node(doc, root, "aired", date)
-        DomUtils.add_node(doc, root, "dateadded", formatted_time)
+            root.add("aired", date)
+        root.add_dateadded()
         # 标题
 
         if end_episode:
-            DomUtils.add_node(doc, root, "title", f"第 {episode}-{end_episode} 集")
+            root.add("title", f"第 {episode}-{end_episode} 集")
         else:
-            DomUtils.add_node(doc, root, "title", f"第 {episode} 集")
-        DomUtils.add_node(doc, root, "year", year)
-        DomUtils.add_node(doc, root, "season", season)
-        DomUtils.add_node(doc, root, "episode", episode)
+            root.add("title", f"第 {episode} 集")
+        root.add("year", year)
+        root.add("season", season)
+        root.add("episode", episode)
         # 保存
-        self.__save_nfo(doc, dir_path.joinpath(f"{name}.nfo"))
+        self.__save_nfo(root, dir_path.joinpath(f"{name}.nfo"))
 
-    def __save_nfo(self, doc, file_path: Path):
+    def __save_nfo(self, root: NfoNode, file_path: Path):
         """
-        保存NFO
+        保存NFO，内容没有变化时不重写
         """
-        xml_str = doc.toprettyxml(indent="  ", encoding="utf-8")
-        file_path.write_bytes(xml_str)
-        logger.info(f"NFO文件已保存：{file_path}")
+        formatted_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._nfo_writer.write(root, file_path, formatted_time)
 
     @retry(RequestException, logger=logger)
     def __save_image(self, url: str, file_path: Path):
         """
         下载图片并保存
         """
-        if url in self._img_error_cache.keys():
-            if self._img_error_cache.get(url) > self._error_count:
-                logger.info(f"图片下载失败次数超过{self._error_count}次：{url}")
-                return False
-        else:
-            self._img_error_cache[url] = 0
+        with self._state_lock:
+            img_errors = self._img_error_cache.setdefault(url, 0)
+        if img_errors > self._error_count:
+            logger.info(f"图片下载失败次数超过{self._error_count}次：{url}")
+            return False
 
         try:
             logger.info(f"正在下载{file_path.stem}图片：{url} ...")
-            r = RequestUtils().get_res(url=url, raise_exception=True)
-            if r:
-                file_path.write_bytes(r.content)
+            if self._artwork_cache.fetch(url=url, file_path=file_path):
                 logger.debug(f"图片已保存：{file_path}")
-                self._img_error_cache[url] = 0
+                self.__set_img_error(url, reset=True)
                 return True
             else:
                 logger.warn(f"{file_path.stem}图片下载失败，请检查网络连通性")
-                self._img_error_cache[url] = self._img_error_cache.get(url) + 1
+                self.__set_img_error(url)
                 return False
         except RequestException as err:
-            self._img_error_cache[url] = self._img_error_cache.get(url) + 1
+            self.__set_img_error(url)
             raise err
         except Exception as err:
             logger.error(f"{file_path.stem}图片下载失败：{str(err)}")
-            self._img_error_cache[url] = self._img_error_cache.get(url) + 1
+            self.__set_img_error(url)
             return False
 
+    def __set_img_error(self, url: str, reset: bool = False):
+        """
+        更新图片下载失败次数
+        :param reset: 下载成功时清零
+        """
+        with self._state_lock:
+            self._img_error_cache[url] = 0 if reset else self._img_error_cache.get(url, 0) + 1
+
     def __get_thumb(self, video_path: str, image_path: str, frames: str = None):
         """
         使用ffmpeg从视频文件中截取缩略图
         """
-        def _get_thumb_task(video_path, image_path, frames):
-            if not frames:
-                frames = self._timeline
-            if not video_path or not image_path:
-                return False
-            cmd = f'ffmpeg -y -i "{video_path}" -ss "{frames}" -frames 1 "{image_path}"'
-            result = SystemUtils.execute(cmd)
-            if result:
-                logger.warn(f"截取视频缩略图：{video_path}，信息：{result}")
-
-        if self._event.is_set():
+        if self._event.is_set() or not self._thumb_queue:
             return False
 
-        # 提交任务到线程池
-        future = self._thread_pool.submit(_get_thumb_task, video_path, image_path, frames)
-        if future:
-            return True
-        return False
-
-    @staticmethod
-    def __get_dir_image(dir_path: str):
-        max_image = None
-        max_size = 0
-        # 支持的图片文件格式
-        image_extensions = (".jpg", ".jpeg", ".png")
-        tag_img = ["folder.jpg", "poster.jpg"]
+        # 提交任务到缩略图队列
+        return self._thumb_queue.submit(video_path, image_path, frames)
 
+    def __get_dir_image(self, dir_path: str, batch: SyncBatch = None):
+        """
+        目录中的封面图片，优先folder.jpg、poster.jpg，没有时使用最大的图片
+        """
         if not os.path.isdir(dir_path):
             dir_path = Path(dir_path).parent
-        # 遍历目录中的文件
-        for filename in os.listdir(dir_path):
-            file_path = os.path.join(dir_path, filename)
-            if os.path.isfile(file_path) and filename.lower().endswith(image_extensions):
-                if filename.lower() in tag_img:
-                    return file_path
-                file_size = os.path.getsize(file_path)
-                if file_size > max_size:
-                    max_size = file_size
-                    max_image = file_path
-
-        return max_image
+        return self.__dir_snapshot(dir_path, batch).best_image
 
     def send_msg(self):
         """
         定时检查是否有媒体处理完，发送统一消息
         """
         if self._notify:
-            if not self._medias or not self._medias.keys():
-                return
+            # 在锁内取出已刮削完的媒体，发送消息时不持有锁
+            ready = []
+            with self._state_lock:
+                if not self._medias:
+                    return
 
-            # 遍历检查是否已刮削完，发送消息
-            for medis_title_year in list(self._medias.keys()):
-                media_list = self._medias.get(medis_title_year)
-                logger.info(f"开始处理媒体 {medis_title_year} 消息")
+                # 遍历检查是否已刮削完
+                for medis_title_year in list(self._medias.keys()):
+                    media_list = self._medias.get(medis_title_year)
+                    logger.info(f"开始处理媒体 {medis_title_year} 消息")
 
-                if not media_list:
-                    continue
+                    if not media_list:
+                        continue
 
-                # 获取最后更新时间
-                last_update_time = media_list.get("time")
-                media_files = media_list.get("files")
-                if not last_update_time or not media_files:
-                    continue
+                    # 获取最后更新时间
+                    last_update_time = media_list.get("time")
+                    media_files = media_list.get("files")
+                    if not last_update_time or not media_files:
+                        continue
 
-                # 判断剧集最后更新时间距现在是已超过10秒或者电影，发送消息
-                if (datetime.datetime.now() - last_update_time).total_seconds() > int(self._interval):
-                    # 发送消息
-                    self.post_message(mtype=NotificationType.Organize,
-                                      title=f"{medis_title_year} 共{len(media_files)}集已入库",
-                                      text="类别：短剧")
-                    # 发送完消息，移出key
-                    del self._medias[medis_title_year]
-                    continue
+                    # 判断剧集最后更新时间距现在是已超过10秒或者电影，移出key后发送消息
+                    if (datetime.datetime.now() - last_update_time).total_seconds() > int(self._interval):
+                        ready.append((medis_title_year, len(media_files)))
+                        del self._medias[medis_title_year]
+
+            for medis_title_year, file_count in ready:
+                # 发送消息
+                self.post_message(mtype=NotificationType.Organize,
+                                  title=f"{medis_title_year} 共{file_count}集已入库",
+                                  text="类别：短剧")
 
     def get_state(self) -> bool:
         return self._enabled
@@ -1361,7 +1524,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -1378,7 +1541,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -1400,7 +1563,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -1412,6 +1575,79 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'max_workers',
+                                            'label': '整理线程数',
+                                            'placeholder': '不同剧集同时整理的数量，默认4'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'image_quality',
+                                            'label': '图片保存质量',
+                                            'placeholder': '1-100，默认75'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'image_max_height',
+                                            'label': '图片最大高度',
+                                            'placeholder': '超过时等比缩小，0不缩小'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'settle_seconds',
+                                            'label': '文件稳定等待时间(秒)',
+                                            'placeholder': '监控到的文件多久没有变化开始整理，默认5'
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     },
@@ -1529,7 +1765,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -1545,7 +1781,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -1561,7 +1797,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 4
+                                    'md': 3
                                 },
                                 'content': [
                                     {
@@ -1572,6 +1808,22 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'fixlink_verify',
+                                            'label': '硬链接完整校验',
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     },
@@ -1629,6 +1881,10 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
             "cron": "",
             "interval": 10,
             "collection_size": 300,
+            "max_workers": 4,
+            "settle_seconds": 5,
+            "image_quality": 75,
+            "image_max_height": 0,
             "storage_type": "local",
             "transfer_type": "link",
             "monitor_dirs": "",
@@ -1639,6 +1895,7 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
             "onlyonce": False,
             "update": False,
             "fixlink": False,
+            "fixlink_verify": False,
         }
 
     def get_page(self) -> List[dict]:
@@ -1657,6 +1914,19 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                     print(str(e))
             self._observer = []
 
+        if self._event_queue:
+            self._event_queue.stop()
+            self._event_queue = None
+
+        if self._worker_pool:
+            # 停止等待中的整理任务
+            self._event.set()
+            try:
+                self._worker_pool.shutdown(wait=True, cancel_futures=True)
+            except Exception as e:
+                logger.error(f"整理线程池关闭失败：{e}")
+            self._worker_pool = None
+
         if self._scheduler:
             self._scheduler.remove_all_jobs()
             if self._scheduler.running:
@@ -1665,124 +1935,12 @@ class PlayletPolishScrape(_PluginBase, ConfigReloadMixin):
                 self._event.clear()
             self._scheduler = None
 
-        if self._thread_pool:
+        if self._thumb_queue:
             try:
-                self._thread_pool.shutdown(wait=True)
+                # 取消排队的截图，等待正在运行的ffmpeg结束
+                self._thumb_queue.stop(cancel=True)
             except Exception as e:
-                logger.error(f"线程池关闭失败：{e}")
-            self._thread_pool = None
+                logger.error(f"缩略图队列关闭失败：{e}")
+            self._thumb_queue = None
 
         self._event.clear()
-
-def to_pinyin_with_title(s):
-    '''
-    中文标题转拼音英文标题
-    '''
-    if not s:
-        return ""
-
-    p = Pinyin()
-    pinyin_list = []
-    for z in s:
-        pinyin_list.append(p.get_pinyin(z, '').title())
-
-    title = ""
-    for world in pinyin_list:
-        if world.isdigit():
-            title += world
-        else:
-            title += f" {world} "
-
-    return title.replace('，', ',').replace('  ', ' ').strip()
-
-def meta_search_tv_name(file_meta: MetaInfoPath, tv_name: str, is_compilations: bool = False):
-    '''
-    针对短剧识别标题
-    :param file_meta: 文件元数据
-    :param tv_name: 电视剧名
-    :param is_compilations: 是否合集
-    :return 一个新的文件元数据
-    '''
-
-    org_string = tv_name
-    tv_name = tv_name.strip('.')
-    tv_name = re.sub(r'^\d+[-.]*', '', tv_name)
-    tv_name = tv_name.replace('（', '(').replace('）', ')').replace('＆', '&')
-    bracket_match = re.match(r'^【(.*)】$', tv_name)
-    if bracket_match:
-        tv_name = bracket_match.group(1)
-    else:
-        tv_name = re.sub(r"【.*】", '', tv_name)
-    tv_name = re.sub(r"\[.*\]", '', tv_name)
-    logger.info(f"尝试识别媒体信息：{tv_name}")
-    match = re.match(r'^(.*?)\(?([全共]?\d+)[集话話期幕][全完]?\)?(?:&?(.+))?', tv_name)
-    if match:
-        title = match.group(1).strip()
-        if title[0] == '(':
-            title = title.split(')')[1]
-        else:
-            title = title.split('(')[0]
-        try:
-            episodes = int(match.group(2))
-        except:
-            episodes = 0
-        actors = match.group(3)
-        if actors and not '剧' in actors:
-            actors = actors.replace('/', ' ').strip()
-            if '&' in actors:
-                actor_list = actors.split('&')
-            else:
-                actor_list = [actor.strip() for actor in actors.split() if len(actor) <= 4]
-        else:
-            actor_list = []
-    else:
-        match = re.search(r'《.+》', tv_name)
-        if match:
-            tv_name = match.group(0).replace('《', '').replace('》', '').strip()
-
-        title = tv_name.split('(')[0]
-        episodes = 0
-        actor_list = []
-
-    if '-' in file_meta.org_string and file_meta.begin_episode is None:
-        ep_match = re.search(r'^(\d+)[.-](\d+)\b', file_meta.org_string)
-        if ep_match:
-            try:
-                file_meta.begin_episode = int(ep_match.group(1))
-                file_meta.end_episode = int(ep_match.group(2))
-                if file_meta.begin_episode == file_meta.end_episode:
-                    file_meta.end_episode = None
-            except:
-                logger.error(f"文件名获取的集数错误({ep_match.group(1)}-{ep_match.group(2)})")
-
-        else:
-            ep_match = re.search(r'^(\d+)[.-]([0-9a-zA-Z]+)\b', file_meta.org_string)
-            if ep_match:
-                try:
-                    file_meta.begin_episode = int(ep_match.group(1))
-                except:
-                    logger.error(f"文件名获取的集数错误({ep_match.group(1)})")
-
-    if actor_list:
-        actors = ' '.join(actor_list)
-        subtitle = f"{title} | 演员：{actors}"
-    else:
-        subtitle = tv_name
-
-    title = title.replace('$', ' ').replace('&', ' ').strip()
-
-    file_meta.org_string = org_string
-    file_meta.subtitle = subtitle
-    file_meta.cn_name = title
-    file_meta.en_name = to_pinyin_with_title(title)
-
-    if is_compilations:
-        file_meta.begin_season = 0
-        file_meta.total_season = 1
-        if file_meta.begin_episode is None:
-            file_meta.begin_episode = 1
-    else:
-        file_meta.begin_season = 1
-        file_meta.total_season = 1
-        file_meta.total_episode = episodes
-    return file_meta
\ No newline at end of file
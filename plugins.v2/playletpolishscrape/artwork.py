@@ -0,0 +1,179 @@
+"""
+图片下载缓存
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from requests import RequestException
+
+from app.core.config import settings
+from app.log import logger
+from app.utils.http import RequestUtils
+
+# 超过多少倍max_age没有检查过的记录被清理
+PRUNE_AGE_FACTOR = 30
+
+
+class ArtworkCache:
+    """
+    按URL缓存下载的图片，图片内容按hash保存在数据目录，相同内容只存一份
+    缓存未过期时直接使用本地图片，过期后使用ETag/Last-Modified发送条件请求，下载失败时使用旧的图片
+    """
+
+    def __init__(self, data_path: str, max_age: int = 86400):
+        """
+        :param data_path: 数据目录路径
+        :param max_age: 多少秒内不再请求，直接使用缓存
+        """
+        self.data_path = data_path
+        self.data_file = os.path.join(data_path, "artwork.db")
+        self.blob_path = os.path.join(data_path, "artwork")
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.__init_db()
+
+    @contextmanager
+    def __connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.data_file)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __init_db(self):
+        try:
+            os.makedirs(self.blob_path, exist_ok=True)
+            with self.__connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS artwork ("
+                             "url TEXT PRIMARY KEY, "
+                             "hash TEXT NOT NULL, "
+                             "etag TEXT, "
+                             "last_modified TEXT, "
+                             "checked REAL NOT NULL)")
+        except Exception as e:
+            logger.error(f"初始化图片缓存数据库失败: {str(e)}")
+
+    def __blob(self, content_hash: str) -> str:
+        return os.path.join(self.blob_path, content_hash[:2], content_hash)
+
+    def __get(self, url: str) -> Optional[Tuple[str, Optional[str], Optional[str], float]]:
+        """
+        :return: (内容hash, ETag, Last-Modified, 上次检查时间)，本地图片已丢失时返回None
+        """
+        try:
+            with self.__connect() as conn:
+                row = conn.execute("SELECT hash, etag, last_modified, checked FROM artwork WHERE url = ?",
+                                   (url,)).fetchone()
+        except Exception as e:
+            logger.error(f"读取图片缓存失败: {str(e)}")
+            return None
+        if row and os.path.exists(self.__blob(row[0])):
+            return row
+        return None
+
+    def __put(self, url: str, content_hash: str, etag: Optional[str], last_modified: Optional[str]):
+        try:
+            with self.__connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO artwork (url, hash, etag, last_modified, checked) "
+                             "VALUES (?, ?, ?, ?, ?)", (url, content_hash, etag, last_modified, time.time()))
+        except Exception as e:
+            logger.error(f"保存图片缓存失败: {str(e)}")
+
+    def __store(self, content: bytes) -> str:
+        """
+        保存图片内容
+        :return: 内容hash
+        """
+        content_hash = hashlib.sha1(content).hexdigest()
+        blob = self.__blob(content_hash)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp = f"{blob}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, blob)
+        return content_hash
+
+    def __copy(self, content_hash: str, file_path: Path):
+        shutil.copyfile(self.__blob(content_hash), file_path)
+
+    def fetch(self, url: str, file_path: Path) -> bool:
+        """
+        下载图片保存到file_path，优先使用缓存
+        :return: 是否保存成功，网络错误且没有缓存时抛出RequestException
+        """
+        cached = self.__get(url)
+        headers = {"User-Agent": settings.USER_AGENT}
+        if cached:
+            content_hash, etag, last_modified, checked = cached
+            if time.time() - checked < self.max_age:
+                logger.debug(f"使用缓存的图片：{url}")
+                self.__copy(content_hash, file_path)
+                return True
+            # 发送条件请求，没有变化时服务器返回304
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        try:
+            r = RequestUtils(headers=headers).get_res(url=url, raise_exception=True)
+        except RequestException:
+            if not cached:
+                raise
+            logger.warn(f"图片下载失败，使用缓存的图片：{url}")
+            self.__copy(content_hash, file_path)
+            return True
+        if cached and r is not None and r.status_code == 304:
+            logger.debug(f"图片没有变化，使用缓存：{url}")
+            self.__put(url, content_hash, etag, last_modified)
+            self.__copy(content_hash, file_path)
+            return True
+        if not r:
+            if not cached:
+                return False
+            logger.warn(f"图片下载失败，使用缓存的图片：{url}")
+            self.__copy(content_hash, file_path)
+            return True
+        with self._lock:
+            # 保存记录后才释放锁，避免清理时删除刚保存的图片
+            content_hash = self.__store(r.content)
+            self.__put(url, content_hash, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        file_path.write_bytes(r.content)
+        return True
+
+    def prune(self, age_factor: int = PRUNE_AGE_FACTOR) -> int:
+        """
+        清理长时间没有使用的记录，以及没有记录引用的图片（URL内容变化后的旧图片、中断写入的临时文件）
+        :param age_factor: 超过多少倍max_age没有检查过的记录被清理
+        :return: 删除的图片数
+        """
+        removed = 0
+        with self._lock:
+            try:
+                with self.__connect() as conn:
+                    conn.execute("DELETE FROM artwork WHERE checked < ?",
+                                 (time.time() - self.max_age * age_factor,))
+                    referenced = {row[0] for row in conn.execute("SELECT DISTINCT hash FROM artwork")}
+            except Exception as e:
+                logger.error(f"清理图片缓存记录失败: {str(e)}")
+                return 0
+            for root, _, files in os.walk(self.blob_path):
+                for name in files:
+                    if name in referenced:
+                        continue
+                    try:
+                        os.remove(os.path.join(root, name))
+                        removed += 1
+                    except OSError as e:
+                        logger.debug(f"删除缓存图片 {name} 失败：{str(e)}")
+        if removed:
+            logger.info(f"清理图片缓存 {removed} 个")
+        return removed
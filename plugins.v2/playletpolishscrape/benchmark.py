@@ -0,0 +1,336 @@
+"""
+标题整理、拼音转换和媒体库文件检查的性能对比，并检查新旧实现的结果一致
+在MoviePilot目录下运行：python -m plugins.playletpolishscrape.benchmark --repeat 200
+"""
+import argparse
+import copy
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from xpinyin import Pinyin
+
+from app.core.metainfo import MetaInfoPath
+from app.log import logger
+from app.utils.string import StringUtils
+
+from plugins.playletpolishscrape import normalize
+from plugins.playletpolishscrape.normalize import TitleNormalizer, meta_search_tv_name
+from plugins.playletpolishscrape.storage import FakeRemoteBackend
+from plugins.playletpolishscrape.titlecheck import CORPUS, INVALID_NAME, LegacyPatterns, check_patterns
+
+RENAME_TITLE = "闪婚后傅先生=>闪婚后傅先生马甲藏不住了\nZong Cai=>霸道总裁\n无双战神=>无双战神$归来\nLong Wang Dian=>Dragon King"
+
+
+class LegacyNormalizer(LegacyPatterns):
+    """
+    旧版本的实现：每个文件都重新拆分配置并使用字符串正则
+    """
+
+    def __init__(self, rename_title: str, invalid_name: str):
+        super().__init__(invalid_name)
+        self._rename_title = rename_title
+
+    @staticmethod
+    def chinese_tv_name(title):
+        tv_name = ""
+        for word in re.split(r'[ .\-~·]', title):
+            if StringUtils.is_chinese(word):
+                tv_name += f"{word} "
+        logger.info(f'chinese_tv_name={tv_name}')
+        return tv_name.strip()
+
+    def rename_title(self, file_meta):
+        if self._rename_title:
+            rename_titles = self._rename_title.split("\n")
+            for rename_title in rename_titles:
+                if not '=>' in rename_title:
+                    continue
+                old_title = rename_title.split('=>')[0].strip()
+                new_title = rename_title.split('=>')[1].strip().replace('$', ' ').replace('&', ' ').strip()
+                if StringUtils.is_chinese(new_title):
+                    if file_meta.cn_name and re.search(rf"{old_title}", file_meta.cn_name):
+                        logger.info(f"替换标题：{file_meta.cn_name} => {new_title}")
+                        file_meta.cn_name = new_title
+                        file_meta.en_name = normalize.to_pinyin_with_title(new_title)
+                        break
+                else:
+                    if file_meta.en_name and re.search(rf"{old_title}", file_meta.en_name):
+                        logger.info(f"替换标题：{file_meta.en_name} => {new_title}")
+                        file_meta.cn_name = None
+                        file_meta.en_name = old_title
+                        break
+        return file_meta
+
+
+def legacy_to_pinyin_with_title(s):
+    """
+    旧版本的to_pinyin_with_title：每次调用都新建Pinyin，重新加载字典
+    """
+    if not s:
+        return ""
+
+    p = Pinyin()
+    pinyin_list = []
+    for z in s:
+        pinyin_list.append(p.get_pinyin(z, '').title())
+
+    title = ""
+    for world in pinyin_list:
+        if world.isdigit():
+            title += world
+        else:
+            title += f" {world} "
+
+    return title.replace('，', ',').replace('  ', ' ').strip()
+
+
+def pinyin_benchmark(titles: List[str]):
+    """
+    对比拼音转换，每部剧的各集标题相同
+    """
+    start = time.perf_counter()
+    old_titles = [legacy_to_pinyin_with_title(title) for title in titles]
+    old_elapsed = time.perf_counter() - start
+    print(f"拼音转换旧实现：{len(titles)}个标题，耗时{old_elapsed:.3f}秒")
+
+    normalize.to_pinyin_with_title.cache_clear()
+    start = time.perf_counter()
+    new_titles = [normalize.to_pinyin_with_title(title) for title in titles]
+    new_elapsed = time.perf_counter() - start
+    print(f"拼音转换共用字典并缓存：{len(titles)}个标题，耗时{new_elapsed:.3f}秒，"
+          f"{normalize.to_pinyin_with_title.cache_info()}")
+    assert old_titles == new_titles, "拼音转换结果不一致"
+
+
+def legacy_meta_search_tv_name(file_meta: MetaInfoPath, tv_name: str, is_compilations: bool = False):
+    """
+    旧版本的meta_search_tv_name
+    """
+    org_string = tv_name
+    tv_name = tv_name.strip('.')
+    tv_name = re.sub(r'^\d+[-.]*', '', tv_name)
+    tv_name = tv_name.replace('（', '(').replace('）', ')').replace('＆', '&')
+    bracket_match = re.match(r'^【(.*)】$', tv_name)
+    if bracket_match:
+        tv_name = bracket_match.group(1)
+    else:
+        tv_name = re.sub(r"【.*】", '', tv_name)
+    tv_name = re.sub(r"\[.*\]", '', tv_name)
+    logger.info(f"尝试识别媒体信息：{tv_name}")
+    match = re.match(r'^(.*?)\(?([全共]?\d+)[集话話期幕][全完]?\)?(?:&?(.+))?', tv_name)
+    if match:
+        title = match.group(1).strip()
+        if title[0] == '(':
+            title = title.split(')')[1]
+        else:
+            title = title.split('(')[0]
+        try:
+            episodes = int(match.group(2))
+        except:
+            episodes = 0
+        actors = match.group(3)
+        if actors and not '剧' in actors:
+            actors = actors.replace('/', ' ').strip()
+            if '&' in actors:
+                actor_list = actors.split('&')
+            else:
+                actor_list = [actor.strip() for actor in actors.split() if len(actor) <= 4]
+        else:
+            actor_list = []
+    else:
+        match = re.search(r'《.+》', tv_name)
+        if match:
+            tv_name = match.group(0).replace('《', '').replace('》', '').strip()
+
+        title = tv_name.split('(')[0]
+        episodes = 0
+        actor_list = []
+
+    if '-' in file_meta.org_string and file_meta.begin_episode is None:
+        ep_match = re.search(r'^(\d+)[.-](\d+)\b', file_meta.org_string)
+        if ep_match:
+            file_meta.begin_episode = int(ep_match.group(1))
+            file_meta.end_episode = int(ep_match.group(2))
+            if file_meta.begin_episode == file_meta.end_episode:
+                file_meta.end_episode = None
+        else:
+            ep_match = re.search(r'^(\d+)[.-]([0-9a-zA-Z]+)\b', file_meta.org_string)
+            if ep_match:
+                file_meta.begin_episode = int(ep_match.group(1))
+
+    if actor_list:
+        actors = ' '.join(actor_list)
+        subtitle = f"{title} | 演员：{actors}"
+    else:
+        subtitle = tv_name
+
+    title = title.replace('$', ' ').replace('&', ' ').strip()
+
+    file_meta.org_string = org_string
+    file_meta.subtitle = subtitle
+    file_meta.cn_name = title
+    file_meta.en_name = normalize.to_pinyin_with_title(title)
+
+    if is_compilations:
+        file_meta.begin_season = 0
+        file_meta.total_season = 1
+        if file_meta.begin_episode is None:
+            file_meta.begin_episode = 1
+    else:
+        file_meta.begin_season = 1
+        file_meta.total_season = 1
+        file_meta.total_episode = episodes
+    return file_meta
+
+
+def complement(normalizer, search_tv_name: Callable, media_path: str, file_meta: MetaInfoPath) -> MetaInfoPath:
+    """
+    插件__meta_complement中和标题相关的部分，不访问文件系统
+    """
+    _path = Path(media_path)
+    tv_path = _path
+    org_new = normalizer.strip_org_bracket(file_meta.title)
+    if org_new is not None:
+        file_meta.org_string = org_new
+    org_string = file_meta.org_string
+
+    se_match = normalizer.season_episode(org_string)
+    if se_match:
+        file_meta.begin_season, file_meta.begin_episode = se_match
+
+    if _path.parent.name in ['合集', '合集版', '长篇', '长篇版', '长篇合集', '合集长篇']:
+        file_meta = search_tv_name(file_meta, normalizer.chinese_tv_name(_path.parent.parent.name), True)
+    elif file_meta.cn_name and file_meta.year:
+        pass
+    elif normalizer.extra_episode(org_string):
+        file_meta = search_tv_name(file_meta, normalizer.chinese_tv_name(_path.parent.name), True)
+        story_match = normalizer.extra_episode(org_string)
+        if story_match.group(1):
+            file_meta.begin_season = 0
+            file_meta.begin_episode = int(story_match.group(1))
+    elif normalizer.is_episode_name(org_string):
+        tv_path = _path.parent
+        if tv_path.name == "分集":
+            tv_path = tv_path.parent
+        file_meta = search_tv_name(file_meta, normalizer.chinese_tv_name(tv_path.name))
+    elif file_meta.cn_name:
+        file_meta = search_tv_name(file_meta, normalizer.chinese_tv_name(org_string))
+    elif file_meta.name and StringUtils.is_chinese(tv_path.parent.name):
+        file_meta = search_tv_name(file_meta, normalizer.chinese_tv_name(tv_path.parent.name))
+
+    if file_meta.begin_episode is None:
+        ep_match = normalizer.episode_number(org_string)
+        if ep_match:
+            file_meta.begin_episode = int(ep_match.group(1))
+    return normalizer.rename_title(file_meta)
+
+
+def result(file_meta: MetaInfoPath) -> Tuple:
+    return (file_meta.cn_name, file_meta.en_name, file_meta.subtitle, file_meta.org_string,
+            file_meta.begin_season, file_meta.begin_episode, file_meta.end_episode,
+            file_meta.total_season, file_meta.total_episode)
+
+
+def run(normalizer, search_tv_name: Callable, paths: List[str], metas: List[MetaInfoPath]) -> Tuple[List[Tuple], float]:
+    start = time.perf_counter()
+    results = [complement(normalizer, search_tv_name, path, meta) for path, meta in zip(paths, metas)]
+    elapsed = time.perf_counter() - start
+    return [result(meta) for meta in results], elapsed
+
+
+def check(legacy: LegacyNormalizer, normalizer: TitleNormalizer):
+    """
+    检查新旧实现的整理结果一致
+    """
+    metas = [MetaInfoPath(Path(path)) for path in CORPUS]
+    old_results, _ = run(legacy, legacy_meta_search_tv_name, CORPUS, copy.deepcopy(metas))
+    new_results, _ = run(normalizer, meta_search_tv_name, CORPUS, copy.deepcopy(metas))
+    for path, old, new in zip(CORPUS, old_results, new_results):
+        assert old == new, f"整理结果不一致：{path}\n旧：{old}\n新：{new}"
+    print(f"{len(CORPUS)}个文件名整理结果一致")
+
+
+def storage_benchmark(episodes: int, latency: float):
+    """
+    对比刮削时检查媒体库文件的往返次数，模拟网络挂载
+    """
+    root = tempfile.mkdtemp(prefix="playlet_bench_")
+    try:
+        tv_path = os.path.join(root, "短剧 (2024)") + "/"
+        se_path = os.path.join(tv_path, "Season 1")
+        os.makedirs(se_path)
+        for name in ("tvshow.nfo", "poster.jpg", "folder.jpg"):
+            open(os.path.join(tv_path, name), "wb").close()
+        episode_files = []
+        for episode in range(1, episodes + 1):
+            name = f"短剧 - S01E{episode:02d}"
+            for suffix in (".mp4", ".nfo"):
+                open(os.path.join(se_path, name + suffix), "wb").close()
+            episode_files.append((os.path.join(se_path, name + ".mp4"), f"{se_path}/{name}.nfo",
+                                  os.path.join(se_path, name + "-thumb.jpg")))
+        series_files = [f"{tv_path}/tvshow.nfo", f"{se_path}/season.nfo", f"{tv_path}poster.jpg",
+                        f"{tv_path}folder.jpg", f"{tv_path}landscape.jpg", f"{tv_path}season01-poster.jpg"]
+
+        # 旧实现：每个文件os.path.exists一次
+        backend = FakeRemoteBackend(latency)
+        start = time.perf_counter()
+        old_result = [backend.stat(path) is not None for path in series_files]
+        for files in episode_files:
+            old_result.extend(backend.stat(path) is not None for path in files)
+        old_elapsed = time.perf_counter() - start
+        print(f"逐个检查媒体库文件：{backend.round_trips}次往返，耗时{old_elapsed:.3f}秒")
+
+        # 新实现：同一目录的文件一次检查
+        backend = FakeRemoteBackend(latency)
+        start = time.perf_counter()
+        new_result = list(backend.exists_many(series_files[:2]).values())
+        new_result.extend(backend.exists_many(series_files[2:]).values())
+        for files in episode_files:
+            new_result.extend(backend.exists_many(files).values())
+        new_elapsed = time.perf_counter() - start
+        print(f"按目录批量检查：{backend.round_trips}次往返，耗时{new_elapsed:.3f}秒")
+        assert old_result == new_result, "检查结果不一致"
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="短剧整理刮削 性能对比")
+    parser.add_argument("--repeat", type=int, default=200, help="文件列表重复次数")
+    parser.add_argument("--pinyin-repeat", type=int, default=10, help="拼音转换对比的文件列表重复次数")
+    parser.add_argument("--episodes", type=int, default=80, help="媒体库检查对比的集数")
+    parser.add_argument("--latency", type=float, default=0.002, help="模拟网络挂载每次往返的延迟（秒）")
+    args = parser.parse_args()
+
+    legacy = LegacyNormalizer(RENAME_TITLE, INVALID_NAME)
+    start = time.perf_counter()
+    normalizer = TitleNormalizer(rename_title=RENAME_TITLE, invalid_name=INVALID_NAME)
+    compile_elapsed = time.perf_counter() - start
+    print(f"{check_patterns()}个文件名和目录名正则结果一致")
+    check(legacy, normalizer)
+
+    titles = [meta.cn_name for meta in (complement(normalizer, meta_search_tv_name, path, MetaInfoPath(Path(path)))
+                                        for path in CORPUS) if meta.cn_name]
+    pinyin_benchmark(titles * args.pinyin_repeat)
+    storage_benchmark(args.episodes, args.latency)
+
+    # 拼音转换两边相同且耗时远大于正则，计时时不转换，只比较标题整理
+    normalize.to_pinyin_with_title = str
+    paths = CORPUS * args.repeat
+    metas = [MetaInfoPath(Path(path)) for path in paths]
+
+    _, old_elapsed = run(legacy, legacy_meta_search_tv_name, paths, copy.deepcopy(metas))
+    print(f"旧实现：{len(paths)}个文件，耗时{old_elapsed:.3f}秒，{len(paths) / old_elapsed:.0f}个/秒")
+
+    _, new_elapsed = run(normalizer, meta_search_tv_name, paths, copy.deepcopy(metas))
+    print(f"预编译：{len(paths)}个文件，耗时{new_elapsed:.3f}秒，{len(paths) / new_elapsed:.0f}个/秒，"
+          f"编译耗时{compile_elapsed * 1000:.2f}毫秒")
+
+
+if __name__ == "__main__":
+    main()
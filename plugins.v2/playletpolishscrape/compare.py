@@ -0,0 +1,126 @@
+"""
+修复硬链接时比较两个文件是否相同
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.log import logger
+
+# 抽样块大小
+BLOCK_SIZE = 64 * 1024
+# 除头尾外均匀抽样的块数
+SAMPLE_BLOCKS = 8
+# 缓存的文件数
+CACHE_SIZE = 10000
+
+
+class FileComparator:
+    """
+    依次比较inode、文件大小、抽样块的hash，需要时再比较完整hash
+    hash按 (设备, inode, 大小, 修改时间) 缓存，文件没有变化时不重复读取
+    """
+
+    def __init__(self, block_size: int = BLOCK_SIZE, sample_blocks: int = SAMPLE_BLOCKS,
+                 cache_size: int = CACHE_SIZE):
+        """
+        :param block_size: 抽样块大小
+        :param sample_blocks: 除头尾外均匀抽样的块数
+        :param cache_size: 缓存的文件数
+        """
+        self.block_size = block_size
+        self.sample_blocks = sample_blocks
+        self.cache_size = cache_size
+        # (缓存key, 是否完整hash) => hash
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def __key(st: os.stat_result) -> Tuple[int, int, int, int]:
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+    def __cached(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value
+
+    def __remember(self, key: tuple, value: str):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def __offsets(self, size: int):
+        """
+        抽样位置：开头、均匀分布的中间块、结尾
+        """
+        last = size - self.block_size
+        if last <= 0:
+            return [0]
+        step = last / (self.sample_blocks + 1)
+        return sorted({0, last, *(int(step * i) for i in range(1, self.sample_blocks + 1))})
+
+    def sample_hash(self, path: str, st: os.stat_result = None) -> str:
+        """
+        抽样块的hash，文件小于抽样总大小时等于完整内容的hash
+        """
+        st = st or os.stat(path)
+        key = (self.__key(st), False)
+        value = self.__cached(key)
+        if value is None:
+            if st.st_size <= self.block_size * (self.sample_blocks + 2):
+                # 小文件直接读完整内容
+                value = self.full_hash(path, st)
+            else:
+                digest = hashlib.sha1(str(st.st_size).encode())
+                with open(path, "rb") as f:
+                    for offset in self.__offsets(st.st_size):
+                        f.seek(offset)
+                        digest.update(f.read(self.block_size))
+                value = digest.hexdigest()
+            self.__remember(key, value)
+        return value
+
+    def full_hash(self, path: str, st: os.stat_result = None) -> str:
+        """
+        完整内容的hash
+        """
+        st = st or os.stat(path)
+        key = (self.__key(st), True)
+        value = self.__cached(key)
+        if value is None:
+            digest = hashlib.sha1()
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+            value = digest.hexdigest()
+            self.__remember(key, value)
+        return value
+
+    def same(self, src_path: str, dest_path: str, full: bool = False) -> bool:
+        """
+        比较两个文件是否相同
+        :param full: 抽样相同后是否再比较完整内容
+        """
+        src_stat = os.stat(src_path)
+        dest_stat = os.stat(dest_path)
+        if (src_stat.st_dev, src_stat.st_ino) == (dest_stat.st_dev, dest_stat.st_ino):
+            # 已经是硬链接
+            return True
+        if src_stat.st_size != dest_stat.st_size:
+            logger.debug(f"文件大小不同：{src_path} {src_stat.st_size}，{dest_path} {dest_stat.st_size}")
+            return False
+        if self.sample_hash(src_path, src_stat) != self.sample_hash(dest_path, dest_stat):
+            logger.debug(f"文件抽样内容不同：{src_path} {dest_path}")
+            return False
+        if full and src_stat.st_size > self.block_size * (self.sample_blocks + 2):
+            return self.full_hash(src_path, src_stat) == self.full_hash(dest_path, dest_stat)
+        return True
@@ -0,0 +1,103 @@
+"""
+目录内容缓存
+"""
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from app.core.config import settings
+from app.log import logger
+
+# 支持的图片文件格式
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# 优先使用的图片
+TAG_IMAGES = ("folder.jpg", "poster.jpg")
+
+
+class DirSnapshot:
+    """
+    一次读取的目录内容：文件列表、媒体文件数和最合适的封面图片
+    """
+
+    def __init__(self, dir_path: Union[str, Path]):
+        self.path = str(dir_path)
+        # 目录下所有文件和子目录名
+        self.names: List[str] = []
+        # 图片文件大小
+        self.image_sizes: Dict[str, int] = {}
+        # 媒体文件数，扩展名区分大小写
+        self.media_count = 0
+        # 是否有媒体文件或目录，扩展名不区分大小写
+        self.has_media = False
+        # folder.jpg、poster.jpg，没有时使用最大的图片
+        self.best_image: Optional[str] = None
+        self.__scan()
+
+    def __scan(self):
+        tag_image = None
+        max_size = 0
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    name = entry.name
+                    self.names.append(name)
+                    suffix = os.path.splitext(name)[1]
+                    if suffix.lower() in settings.RMT_MEDIAEXT:
+                        self.has_media = True
+                    if not entry.is_file():
+                        continue
+                    if suffix in settings.RMT_MEDIAEXT:
+                        self.media_count += 1
+                    lower_name = name.lower()
+                    if not lower_name.endswith(IMAGE_EXTENSIONS):
+                        continue
+                    if lower_name in TAG_IMAGES:
+                        tag_image = tag_image or entry.path
+                        continue
+                    size = entry.stat().st_size
+                    self.image_sizes[name] = size
+                    if size > max_size:
+                        max_size = size
+                        self.best_image = entry.path
+        except OSError as e:
+            logger.debug(f"读取目录 {self.path} 失败：{str(e)}")
+        if tag_image:
+            self.best_image = tag_image
+
+
+class DirCache:
+    """
+    一批文件整理时共享的目录内容，每个目录只读取一次，目录监控发现变化时失效
+    """
+
+    def __init__(self):
+        self._snapshots: Dict[str, DirSnapshot] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, dir_path: Union[str, Path]) -> DirSnapshot:
+        key = str(dir_path)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+        snapshot = DirSnapshot(key)
+        with self._lock:
+            return self._snapshots.setdefault(key, snapshot)
+
+    def invalidate(self, path: Union[str, Path]):
+        """
+        文件变化时移除所在目录的缓存，目录变化时同时移除自身
+        """
+        path = Path(path)
+        with self._lock:
+            self._snapshots.pop(str(path), None)
+            self._snapshots.pop(str(path.parent), None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._snapshots)
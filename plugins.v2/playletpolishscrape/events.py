@@ -0,0 +1,141 @@
+"""
+目录监控事件队列
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from app.log import logger
+
+
+class _Pending:
+    """
+    等待文件写入完成的事件
+    """
+    __slots__ = ("source_dir", "is_directory", "size", "mtime", "changed")
+
+    def __init__(self, source_dir: str, is_directory: bool):
+        self.source_dir = source_dir
+        self.is_directory = is_directory
+        self.size = -1
+        self.mtime = -1.0
+        # 最后一次发现文件变化的时间
+        self.changed = time.time()
+
+
+class EventQueue:
+    """
+    合并同一路径的监控事件，文件大小和修改时间稳定后按剧集分组交给回调处理
+    放入事件不做任何IO，不阻塞目录监控线程
+    """
+
+    def __init__(self, emit: Callable[[List[Tuple[str, str, bool]]], None],
+                 group_key: Callable[[str], str], settle: float = 5, interval: float = 1):
+        """
+        :param emit: 处理一组已就绪的文件，参数为 [(文件路径, 监控目录, 是否目录)]
+        :param group_key: 计算文件所属的分组（剧集目录）
+        :param settle: 文件多少秒没有变化认为写入完成
+        :param interval: 检查间隔（秒）
+        """
+        self.emit = emit
+        self.group_key = group_key
+        self.settle = settle
+        self.interval = interval
+        # 路径 => 等待中的事件，同一路径的多次事件只保留一个
+        self._pending: Dict[str, _Pending] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self.__run, name="event-queue", daemon=True)
+        self._worker.start()
+
+    @property
+    def depth(self) -> int:
+        """
+        等待中的文件数
+        """
+        with self._lock:
+            return len(self._pending)
+
+    def put(self, event_path: str, source_dir: str, is_directory: bool = False):
+        """
+        放入事件，同一路径已在等待时重新计时
+        """
+        if self._stop.is_set():
+            return
+        with self._lock:
+            pending = self._pending.get(event_path)
+            if pending:
+                pending.changed = time.time()
+            else:
+                self._pending[event_path] = _Pending(source_dir, is_directory)
+
+    def discard(self, event_path: str):
+        """
+        移除等待中的事件，比如文件被改名
+        """
+        with self._lock:
+            self._pending.pop(event_path, None)
+
+    def __run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.__flush(self.__collect())
+            except Exception as e:
+                logger.error(f"处理目录监控事件出错：{str(e)}")
+
+    def __collect(self) -> List[Tuple[str, str, bool]]:
+        """
+        检查等待中的文件，取出已经写入完成的
+        """
+        with self._lock:
+            items = list(self._pending.items())
+        now = time.time()
+        ready = []
+        removed = []
+        for event_path, pending in items:
+            try:
+                stat = os.stat(event_path)
+            except OSError:
+                # 文件已被删除或移走
+                removed.append((event_path, pending))
+                continue
+            if stat.st_size != pending.size or stat.st_mtime != pending.mtime:
+                pending.size, pending.mtime = stat.st_size, stat.st_mtime
+                pending.changed = now
+            elif now - pending.changed >= self.settle:
+                ready.append((event_path, pending))
+        done = set()
+        with self._lock:
+            for event_path, pending in removed + ready:
+                # 检查期间又有新事件时留到下一轮
+                if pending.changed > now or self._pending.get(event_path) is not pending:
+                    continue
+                del self._pending[event_path]
+                done.add(event_path)
+        return [(event_path, pending.source_dir, pending.is_directory)
+                for event_path, pending in ready if event_path in done]
+
+    def __flush(self, ready: List[Tuple[str, str, bool]]):
+        """
+        按剧集分组交给回调
+        """
+        if not ready:
+            return
+        groups: Dict[str, List[Tuple[str, str, bool]]] = {}
+        for item in ready:
+            groups.setdefault(self.group_key(item[0]), []).append(item)
+        logger.info(f"目录监控：{len(ready)} 个文件写入完成，分为 {len(groups)} 组处理")
+        for group in groups.values():
+            if self._stop.is_set():
+                return
+            self.emit(sorted(group))
+
+    def stop(self):
+        """
+        停止队列，丢弃等待中的事件
+        """
+        self._stop.set()
+        self._worker.join()
+        with self._lock:
+            self._pending.clear()
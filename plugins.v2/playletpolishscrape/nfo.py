@@ -0,0 +1,150 @@
+"""
+NFO文件生成
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.log import logger
+
+# 计算内容hash时dateadded的占位符，每次生成时间不同，不参与比较
+_DATEADDED = "\x00dateadded\x00"
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+class NfoNode:
+    """
+    NFO节点，序列化结果和minidom的toprettyxml(indent="  ")一致
+    """
+    __slots__ = ("tag", "text", "children")
+
+    def __init__(self, tag: str, text=None):
+        self.tag = tag
+        self.text = None if text is None else str(text)
+        self.children: List["NfoNode"] = []
+
+    def add(self, tag: str, text=None) -> "NfoNode":
+        """
+        添加子节点
+        :return: 子节点
+        """
+        node = NfoNode(tag, text)
+        self.children.append(node)
+        return node
+
+    def add_dateadded(self) -> "NfoNode":
+        """
+        添加dateadded节点，写入时填入当前时间
+        """
+        return self.add("dateadded", _DATEADDED)
+
+    def serialize(self, parts: List[str], indent: str = ""):
+        if self.children:
+            parts.append(f"{indent}<{self.tag}>\n")
+            child_indent = indent + "  "
+            for child in self.children:
+                child.serialize(parts, child_indent)
+            parts.append(f"{indent}</{self.tag}>\n")
+        elif self.text is not None:
+            text = self.text if self.text == _DATEADDED else _escape(self.text)
+            parts.append(f"{indent}<{self.tag}>{text}</{self.tag}>\n")
+        else:
+            parts.append(f"{indent}<{self.tag}/>\n")
+
+    def to_xml(self) -> str:
+        parts = ['<?xml version="1.0" encoding="utf-8"?>\n']
+        self.serialize(parts)
+        return "".join(parts)
+
+
+class NfoWriter:
+    """
+    保存NFO文件，内容没有变化时不重写，避免媒体服务器因为修改时间变化重新扫描
+    已写入文件的内容hash保存在sqlite中
+    """
+
+    def __init__(self, data_path: str):
+        """
+        :param data_path: 数据目录路径
+        """
+        self.data_path = data_path
+        self.data_file = os.path.join(data_path, "nfo_hash.db")
+        self._lock = threading.Lock()
+        # 路径 => (内容hash, 文件大小)
+        self._hashes: Optional[Dict[str, Tuple[str, int]]] = None
+        self.__init_db()
+
+    @contextmanager
+    def __connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.data_file)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __init_db(self):
+        try:
+            os.makedirs(self.data_path, exist_ok=True)
+            with self.__connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS nfo_hash ("
+                             "path TEXT PRIMARY KEY, "
+                             "hash TEXT NOT NULL, "
+                             "size INTEGER NOT NULL)")
+        except Exception as e:
+            logger.error(f"初始化NFO数据库失败: {str(e)}")
+
+    def __load(self) -> Dict[str, Tuple[str, int]]:
+        """
+        第一次使用时读取保存的hash，调用前需持有_lock
+        """
+        if self._hashes is None:
+            self._hashes = {}
+            try:
+                with self.__connect() as conn:
+                    for path, content_hash, size in conn.execute("SELECT path, hash, size FROM nfo_hash"):
+                        self._hashes[path] = (content_hash, size)
+            except Exception as e:
+                logger.error(f"读取NFO数据库失败: {str(e)}")
+        return self._hashes
+
+    def write(self, root: NfoNode, file_path: Path, dateadded: str) -> bool:
+        """
+        保存NFO
+        :param root: NFO根节点
+        :param file_path: NFO文件路径
+        :param dateadded: 添加时间
+        :return: 是否写入了文件
+        """
+        xml = root.to_xml()
+        content_hash = hashlib.sha1(xml.encode("utf-8")).hexdigest()
+        key = str(file_path)
+        with self._lock:
+            saved = self.__load().get(key)
+        if saved and saved[0] == content_hash:
+            try:
+                # 文件被其他程序修改或删除时重新生成
+                if os.stat(file_path).st_size == saved[1]:
+                    logger.debug(f"NFO文件没有变化：{file_path}")
+                    return False
+            except OSError:
+                pass
+        content = xml.replace(_DATEADDED, dateadded).encode("utf-8")
+        file_path.write_bytes(content)
+        with self._lock:
+            self.__load()[key] = (content_hash, len(content))
+        try:
+            with self.__connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO nfo_hash (path, hash, size) VALUES (?, ?, ?)",
+                             (key, content_hash, len(content)))
+        except Exception as e:
+            logger.error(f"保存NFO数据库失败: {str(e)}")
+        logger.info(f"NFO文件已保存：{file_path}")
+        return True
@@ -0,0 +1,221 @@
+"""
+短剧标题整理，内置和用户配置的正则在初始化时编译一次
+"""
+import re
+import threading
+from functools import lru_cache
+from typing import List, Optional, Pattern, Tuple
+
+from xpinyin import Pinyin
+
+from app.core.metainfo import MetaInfoPath
+from app.log import logger
+from app.utils.string import StringUtils
+
+from plugins.playletpolishscrape.patterns import TitlePatterns, WORD_SPLIT
+
+# 剧名整理
+_LEADING_NUMBER = re.compile(r'^\d+[-.]*')
+_WHOLE_BRACKET = re.compile(r'^【(.*)】$')
+_BRACKET = re.compile(r"【.*】")
+_SQUARE_BRACKET = re.compile(r"\[.*\]")
+_TITLE_EPISODES = re.compile(r'^(.*?)\(?([全共]?\d+)[集话話期幕][全完]?\)?(?:&?(.+))?')
+_BOOK_TITLE = re.compile(r'《.+》')
+_EPISODE_RANGE = re.compile(r'^(\d+)[.-](\d+)\b')
+_EPISODE_PREFIX = re.compile(r'^(\d+)[.-]([0-9a-zA-Z]+)\b')
+
+
+# 共用的拼音转换，字典只加载一次
+_pinyin: Optional[Pinyin] = None
+_pinyin_lock = threading.Lock()
+
+
+def _get_pinyin() -> Pinyin:
+    global _pinyin
+    if _pinyin is None:
+        with _pinyin_lock:
+            if _pinyin is None:
+                _pinyin = Pinyin()
+    return _pinyin
+
+
+def _compile(pattern: str, name: str) -> Optional[Pattern]:
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        logger.warn(f"{name} {pattern} 不是有效的正则表达式：{str(e)}")
+        return None
+
+
+class TitleNormalizer(TitlePatterns):
+    """
+    标题整理流水线，配置变化时重新创建
+    """
+
+    def __init__(self, rename_title: str = "", invalid_name: str = ""):
+        """
+        :param rename_title: 标题替换规则，一行一个，格式 旧标题=>新标题
+        :param invalid_name: 无效的单集名称，一行一个
+        """
+        super().__init__(invalid_name=invalid_name)
+        for name, error in self.invalid_errors:
+            logger.warn(f"无效单集名称 {name} 不是有效的正则表达式：{error}")
+        # (旧标题正则, 旧标题, 新标题, 新标题是否中文)
+        self.rename_rules: List[Tuple[Pattern, str, str, bool]] = []
+        for rule in (rename_title or "").split("\n"):
+            if '=>' not in rule:
+                continue
+            old_title = rule.split('=>')[0].strip()
+            new_title = rule.split('=>')[1].strip().replace('$', ' ').replace('&', ' ').strip()
+            pattern = _compile(old_title, "标题替换规则")
+            if pattern:
+                self.rename_rules.append((pattern, old_title, new_title, StringUtils.is_chinese(new_title)))
+
+    @staticmethod
+    def chinese_tv_name(title: str) -> str:
+        tv_name = ""
+        for word in WORD_SPLIT.split(title):
+            if StringUtils.is_chinese(word):
+                tv_name += f"{word} "
+        logger.info(f'chinese_tv_name={tv_name}')
+        return tv_name.strip()
+
+    def rename_title(self, file_meta: MetaInfoPath) -> MetaInfoPath:
+        """
+        按配置替换标题
+        """
+        for pattern, old_title, new_title, is_chinese in self.rename_rules:
+            if is_chinese:
+                if file_meta.cn_name and pattern.search(file_meta.cn_name):
+                    logger.info(f"替换标题：{file_meta.cn_name} => {new_title}")
+
+                    file_meta.cn_name = new_title
+                    file_meta.en_name = to_pinyin_with_title(new_title)
+                    break
+            else:
+                if file_meta.en_name and pattern.search(file_meta.en_name):
+                    logger.info(f"替换标题：{file_meta.en_name} => {new_title}")
+                    file_meta.cn_name = None
+                    file_meta.en_name = old_title
+                    break
+        return file_meta
+
+
+@lru_cache(maxsize=4096)
+def to_pinyin_with_title(s):
+    '''
+    中文标题转拼音英文标题，同一部剧的各集标题相同，缓存转换结果
+    '''
+    if not s:
+        return ""
+
+    p = _get_pinyin()
+    pinyin_list = []
+    for z in s:
+        pinyin_list.append(p.get_pinyin(z, '').title())
+
+    title = ""
+    for world in pinyin_list:
+        if world.isdigit():
+            title += world
+        else:
+            title += f" {world} "
+
+    return title.replace('，', ',').replace('  ', ' ').strip()
+
+
+def strip_leading_number(title: str) -> str:
+    return _LEADING_NUMBER.sub('', title)
+
+
+def meta_search_tv_name(file_meta: MetaInfoPath, tv_name: str, is_compilations: bool = False):
+    '''
+    针对短剧识别标题
+    :param file_meta: 文件元数据
+    :param tv_name: 电视剧名
+    :param is_compilations: 是否合集
+    :return 一个新的文件元数据
+    '''
+
+    org_string = tv_name
+    tv_name = tv_name.strip('.')
+    tv_name = _LEADING_NUMBER.sub('', tv_name)
+    tv_name = tv_name.replace('（', '(').replace('）', ')').replace('＆', '&')
+    bracket_match = _WHOLE_BRACKET.match(tv_name)
+    if bracket_match:
+        tv_name = bracket_match.group(1)
+    else:
+        tv_name = _BRACKET.sub('', tv_name)
+    tv_name = _SQUARE_BRACKET.sub('', tv_name)
+    logger.info(f"尝试识别媒体信息：{tv_name}")
+    match = _TITLE_EPISODES.match(tv_name)
+    if match:
+        title = match.group(1).strip()
+        if title[0] == '(':
+            title = title.split(')')[1]
+        else:
+            title = title.split('(')[0]
+        try:
+            episodes = int(match.group(2))
+        except:
+            episodes = 0
+        actors = match.group(3)
+        if actors and not '剧' in actors:
+            actors = actors.replace('/', ' ').strip()
+            if '&' in actors:
+                actor_list = actors.split('&')
+            else:
+                actor_list = [actor.strip() for actor in actors.split() if len(actor) <= 4]
+        else:
+            actor_list = []
+    else:
+        match = _BOOK_TITLE.search(tv_name)
+        if match:
+            tv_name = match.group(0).replace('《', '').replace('》', '').strip()
+
+        title = tv_name.split('(')[0]
+        episodes = 0
+        actor_list = []
+
+    if '-' in file_meta.org_string and file_meta.begin_episode is None:
+        ep_match = _EPISODE_RANGE.search(file_meta.org_string)
+        if ep_match:
+            try:
+                file_meta.begin_episode = int(ep_match.group(1))
+                file_meta.end_episode = int(ep_match.group(2))
+                if file_meta.begin_episode == file_meta.end_episode:
+                    file_meta.end_episode = None
+            except:
+                logger.error(f"文件名获取的集数错误({ep_match.group(1)}-{ep_match.group(2)})")
+
+        else:
+            ep_match = _EPISODE_PREFIX.search(file_meta.org_string)
+            if ep_match:
+                try:
+                    file_meta.begin_episode = int(ep_match.group(1))
+                except:
+                    logger.error(f"文件名获取的集数错误({ep_match.group(1)})")
+
+    if actor_list:
+        actors = ' '.join(actor_list)
+        subtitle = f"{title} | 演员：{actors}"
+    else:
+        subtitle = tv_name
+
+    title = title.replace('$', ' ').replace('&', ' ').strip()
+
+    file_meta.org_string = org_string
+    file_meta.subtitle = subtitle
+    file_meta.cn_name = title
+    file_meta.en_name = to_pinyin_with_title(title)
+
+    if is_compilations:
+        file_meta.begin_season = 0
+        file_meta.total_season = 1
+        if file_meta.begin_episode is None:
+            file_meta.begin_episode = 1
+    else:
+        file_meta.begin_season = 1
+        file_meta.total_season = 1
+        file_meta.total_episode = episodes
+    return file_meta
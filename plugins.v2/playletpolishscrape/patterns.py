@@ -0,0 +1,89 @@
+"""
+文件名整理用到的正则，只依赖标准库，可以脱离MoviePilot单独检查
+"""
+import re
+from typing import List, Optional, Pattern, Tuple
+
+# 内置的无效单集名称，匹配时使用父目录名
+INVALID_NAMES = (r'^\d*月\d*日', '余部C边短剧合集')
+
+# 文件名整理
+_ORG_BRACKET = re.compile(r"\d+.*(\(\d+\))")
+_SEASON_EPISODE = re.compile(r'S(\d+)E(\d+)')
+_EXTRA_EPISODE = re.compile(r'番外(\d*)')
+# 只有集数的文件名
+_EPISODE_NAMES = (
+    re.compile(r'^\d+([.-][0-9a-zA-Z]+)?([.-]\d+)?([集话]|本季完|完结|最终集|大结局)?.?$'),
+    re.compile(r'^\d+[.-]([0-9a-zA-Z]+)-.*'),
+    re.compile(r'^[0-9a-zA-Z]*$'),
+)
+# 集数可能在开头、结尾或括号中
+_EPISODE_NUMBERS = (
+    re.compile(r'^(\d+)\b'),
+    re.compile(r'(\d+)$'),
+    re.compile(r'\((\d+)\)'),
+)
+WORD_SPLIT = re.compile(r'[ .\-~·]')
+
+
+class TitlePatterns:
+    """
+    文件名中的集数、季集、番外和无效名称判断
+    """
+
+    def __init__(self, invalid_name: str = ""):
+        """
+        :param invalid_name: 无效的单集名称，一行一个
+        """
+        names = list(INVALID_NAMES)
+        if invalid_name:
+            names.extend(invalid_name.split("\n"))
+        self.invalid_names: List[Pattern] = []
+        # 编译失败的无效单集名称 (正则, 错误信息)
+        self.invalid_errors: List[Tuple[str, str]] = []
+        for name in names:
+            try:
+                self.invalid_names.append(re.compile(name))
+            except re.error as e:
+                self.invalid_errors.append((name, str(e)))
+
+    def is_invalid_name(self, search_str: str) -> bool:
+        return any(pattern.search(search_str) for pattern in self.invalid_names)
+
+    def is_episode_name(self, org_string: str) -> bool:
+        """
+        文件名只有集数或是无效名称，需要使用目录名识别
+        """
+        return any(pattern.search(org_string) for pattern in _EPISODE_NAMES) or self.is_invalid_name(org_string)
+
+    @staticmethod
+    def strip_org_bracket(org_title: str) -> Optional[str]:
+        """
+        去掉集数后面括号中的数字
+        :return: 没有时返回None
+        """
+        match = _ORG_BRACKET.search(org_title)
+        return org_title.replace(match.group(1), "") if match else None
+
+    @staticmethod
+    def season_episode(org_string: str) -> Optional[Tuple[int, int]]:
+        match = _SEASON_EPISODE.search(org_string)
+        return (int(match.group(1)), int(match.group(2))) if match else None
+
+    @staticmethod
+    def extra_episode(org_string: str) -> Optional[re.Match]:
+        """
+        番外
+        """
+        return _EXTRA_EPISODE.search(org_string)
+
+    @staticmethod
+    def episode_number(org_string: str) -> Optional[re.Match]:
+        """
+        从文件名中找集数
+        """
+        for pattern in _EPISODE_NUMBERS:
+            match = pattern.search(org_string)
+            if match:
+                return match
+        return None
@@ -0,0 +1,105 @@
+"""
+海报裁剪
+"""
+import os
+import shutil
+from pathlib import Path
+from typing import List, Tuple, Union
+
+from PIL import Image
+
+from app.log import logger
+
+
+class PosterPipeline:
+    """
+    源图片只解码一次，按各个长宽比裁剪保存，裁剪区域相同的图片只编码一次，其余硬链接或复制
+    """
+
+    def __init__(self, quality: int = 75, max_height: int = 0):
+        """
+        :param quality: JPEG保存质量
+        :param max_height: 裁剪后图片的最大高度，超过时等比缩小，0不缩小
+        """
+        self.quality = quality
+        self.max_height = max_height
+
+    @staticmethod
+    def crop_box(width: int, height: int, cover_conf: str) -> Tuple[int, int, int, int]:
+        """
+        计算截取区域
+        :param cover_conf: 需要截取的长宽比（比如 16:9）
+        """
+        if not cover_conf:
+            target_ratio = 2 / 3
+        else:
+            covers = cover_conf.split(":")
+            target_ratio = int(covers[0]) / int(covers[1])
+
+        # 计算截取后的大小
+        if width / height > target_ratio:
+            new_height = height
+            new_width = int(new_height * target_ratio)
+        else:
+            new_width = width
+            new_height = int(new_width / target_ratio)
+
+        # 如果截取后的高度小于原图的一半，从图片的下半部分截取
+        if new_height < height / 2:
+            top = height // 2
+        else:
+            top = (height - new_height) // 2
+        left = (width - new_width) // 2
+        return left, top, left + new_width, top + new_height
+
+    @staticmethod
+    def __link(src_path: str, dest_path: str):
+        """
+        硬链接相同的图片，不支持时复制
+        """
+        if os.path.abspath(src_path) == os.path.abspath(dest_path):
+            return
+        if os.path.lexists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(src_path, dest_path)
+        except OSError:
+            shutil.copyfile(src_path, dest_path)
+
+    def __save(self, image: Image.Image, poster_path: str):
+        if self.max_height and image.height > self.max_height:
+            width = max(1, round(image.width * self.max_height / image.height))
+            image = image.resize((width, self.max_height), Image.LANCZOS)
+        if Path(poster_path).suffix.lower() in (".jpg", ".jpeg") and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(poster_path, quality=self.quality)
+
+    def render(self, input_path: Union[str, Path], targets: List[Tuple[str, str]]) -> List[str]:
+        """
+        截取图片做封面
+        :param input_path: 源图片
+        :param targets: [(保存路径, 长宽比)]
+        :return: 保存成功的路径
+        """
+        saved = []
+        if not targets:
+            return saved
+        try:
+            with Image.open(input_path) as image:
+                image.load()
+                # 裁剪区域 => 已保存的路径
+                crops = {}
+                for poster_path, cover_conf in targets:
+                    box = self.crop_box(image.width, image.height, cover_conf)
+                    try:
+                        if box in crops:
+                            self.__link(crops[box], poster_path)
+                        else:
+                            self.__save(image.crop(box), poster_path)
+                            crops[box] = poster_path
+                        saved.append(poster_path)
+                    except Exception as e:
+                        logger.error(f"保存图片 {poster_path} 失败：{str(e)}")
+        except Exception as e:
+            logger.error(f"读取图片 {input_path} 失败：{str(e)}")
+        return saved
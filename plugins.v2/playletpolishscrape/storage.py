@@ -0,0 +1,195 @@
+"""
+存储访问，本地磁盘直接stat，网络挂载（SMB、NFS、rclone/alist等）按目录批量读取，减少网络往返
+"""
+import os
+import re
+import stat
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from app.log import logger
+
+# 网络文件系统类型，fuse挂载（rclone、alist、sshfs等）也按网络存储处理
+NETWORK_FS_TYPES = {"cifs", "smb3", "smbfs", "nfs", "nfs4", "davfs", "9p", "afpfs", "ceph", "glusterfs"}
+
+
+class FileStat:
+    """
+    文件信息，批量读取目录得到的信息只有名称和类型，size、mtime等为None
+    """
+    __slots__ = ("path", "is_dir", "size", "mtime", "inode", "nlink")
+
+    def __init__(self, path: str, is_dir: bool, size: Optional[int] = None, mtime: Optional[float] = None,
+                 inode: Optional[int] = None, nlink: Optional[int] = None):
+        self.path = path
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.inode = inode
+        self.nlink = nlink
+
+    @property
+    def is_file(self) -> bool:
+        return not self.is_dir
+
+    @classmethod
+    def from_stat(cls, path: str, st: os.stat_result) -> "FileStat":
+        return cls(path, is_dir=stat.S_ISDIR(st.st_mode), size=st.st_size, mtime=st.st_mtime,
+                   inode=st.st_ino, nlink=st.st_nlink)
+
+
+class StorageBackend(ABC):
+    """
+    存储访问接口，stat和list_dir各是一次往返
+    """
+    name = "base"
+
+    @abstractmethod
+    def stat(self, path: Union[str, Path]) -> Optional[FileStat]:
+        """
+        :return: 文件不存在时返回None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_dir(self, path: Union[str, Path]) -> Dict[str, FileStat]:
+        """
+        列出目录
+        :return: 文件名 => 文件信息，目录不存在时返回空
+        """
+        raise NotImplementedError
+
+    def stat_many(self, paths: Iterable[Union[str, Path]]) -> Dict[str, Optional[FileStat]]:
+        """
+        批量获取文件信息，同一目录下的多个文件只列一次目录
+        列目录得到的结果只有path和is_dir，size、mtime、inode、nlink为None，调用方只能用来判断是否存在和类型，
+        需要文件大小等信息时使用stat
+        """
+        result: Dict[str, Optional[FileStat]] = {}
+        by_dir: Dict[str, List[str]] = {}
+        for path in paths:
+            path = str(path)
+            by_dir.setdefault(os.path.dirname(path), []).append(path)
+        for dir_path, dir_paths in by_dir.items():
+            if len(dir_paths) == 1:
+                result[dir_paths[0]] = self.stat(dir_paths[0])
+                continue
+            entries = self.list_dir(dir_path)
+            for path in dir_paths:
+                result[path] = entries.get(os.path.basename(path))
+        return result
+
+    def exists_many(self, paths: Iterable[Union[str, Path]]) -> Dict[str, bool]:
+        return {path: file_stat is not None for path, file_stat in self.stat_many(paths).items()}
+
+
+class LocalBackend(StorageBackend):
+    """
+    本地磁盘，stat很快，批量获取时直接逐个stat，不列目录
+    """
+    name = "local"
+
+    def stat(self, path: Union[str, Path]) -> Optional[FileStat]:
+        try:
+            return FileStat.from_stat(str(path), os.stat(path))
+        except OSError:
+            return None
+
+    def list_dir(self, path: Union[str, Path]) -> Dict[str, FileStat]:
+        entries = {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    entries[entry.name] = FileStat(entry.path, is_dir=entry.is_dir())
+        except OSError:
+            pass
+        return entries
+
+    def stat_many(self, paths: Iterable[Union[str, Path]]) -> Dict[str, Optional[FileStat]]:
+        return {str(path): self.stat(path) for path in paths}
+
+
+class MountBackend(LocalBackend):
+    """
+    网络挂载，每次stat都是一次网络往返，批量获取时同一目录只列一次
+    列目录时只使用目录项中的类型，不逐个stat
+    """
+    name = "mount"
+
+    stat_many = StorageBackend.stat_many
+
+
+class FakeRemoteBackend(LocalBackend):
+    """
+    模拟远程存储，每次往返增加延迟并计数，用于测量和对比往返次数
+    """
+    name = "fake"
+
+    stat_many = StorageBackend.stat_many
+
+    def __init__(self, latency: float = 0.005):
+        """
+        :param latency: 每次往返的延迟（秒）
+        """
+        self.latency = latency
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def __round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def stat(self, path: Union[str, Path]) -> Optional[FileStat]:
+        self.__round_trip()
+        return super().stat(path)
+
+    def list_dir(self, path: Union[str, Path]) -> Dict[str, FileStat]:
+        self.__round_trip()
+        return super().list_dir(path)
+
+
+_local = LocalBackend()
+_mount = MountBackend()
+_OCTAL_ESCAPE = re.compile(r"\\([0-7]{3})")
+# (挂载点, 是否网络文件系统)，按挂载点长度倒序
+_mounts: Optional[List[Tuple[str, bool]]] = None
+_mounts_lock = threading.Lock()
+
+
+def _load_mounts() -> List[Tuple[str, bool]]:
+    global _mounts
+    if _mounts is None:
+        with _mounts_lock:
+            if _mounts is None:
+                mounts = []
+                try:
+                    with open("/proc/mounts", encoding="utf-8") as f:
+                        for line in f:
+                            fields = line.split()
+                            if len(fields) < 3:
+                                continue
+                            # 挂载点中的空格等字符被转义为八进制
+                            mount_point = _OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), fields[1])
+                            fs_type = fields[2]
+                            mounts.append((mount_point, fs_type in NETWORK_FS_TYPES or fs_type.startswith("fuse")))
+                except OSError as e:
+                    logger.debug(f"读取挂载信息失败，按本地磁盘处理：{str(e)}")
+                mounts.sort(key=lambda item: len(item[0]), reverse=True)
+                _mounts = mounts
+    return _mounts
+
+
+def backend_for(path: Union[str, Path]) -> StorageBackend:
+    """
+    按路径所在的挂载点选择存储访问方式
+    """
+    path = os.path.abspath(str(path))
+    for mount_point, is_network in _load_mounts():
+        if path == mount_point or path.startswith(mount_point.rstrip("/") + "/"):
+            return _mount if is_network else _local
+    return _local
@@ -0,0 +1,165 @@
+"""
+视频缩略图队列
+"""
+import os
+import queue
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Set, Union
+
+from app.log import logger
+
+# 单个缩略图的ffmpeg超时时间
+FFMPEG_TIMEOUT = 120
+
+
+class ThumbQueue:
+    """
+    使用ffmpeg截取视频缩略图，按输出路径去重，队列满时提交方等待，限制同时运行的ffmpeg进程数
+    """
+
+    def __init__(self, timeline: str = "00:00:10", max_workers: int = None, max_size: int = 1000):
+        """
+        :param timeline: 截图的时间点
+        :param max_workers: 同时运行的ffmpeg数量，默认CPU核数的一半
+        :param max_size: 等待队列的长度
+        """
+        self.timeline = timeline
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        # 排队和正在截取的输出路径
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._workers = []
+        # 统计
+        self._done = 0
+        self._failed = 0
+        self._elapsed = 0.0
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self.__run, name=f"thumb-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    @property
+    def depth(self) -> int:
+        """
+        等待中的任务数
+        """
+        return self._queue.qsize()
+
+    @property
+    def avg_time(self) -> float:
+        """
+        平均截取耗时（秒）
+        """
+        with self._lock:
+            count = self._done + self._failed
+            return self._elapsed / count if count else 0.0
+
+    def stats(self) -> str:
+        with self._lock:
+            done, failed = self._done, self._failed
+        return f"等待 {self.depth} 个，完成 {done} 个，失败 {failed} 个，平均耗时 {self.avg_time:.2f} 秒"
+
+    def submit(self, video_path: Union[str, Path], image_path: Union[str, Path], frames: str = None) -> bool:
+        """
+        提交截图任务，同一输出路径正在处理时不重复提交，队列满时等待
+        :return: 是否已提交
+        """
+        if not video_path or not image_path or self._stop.is_set():
+            return False
+        image_path = str(image_path)
+        with self._lock:
+            if image_path in self._pending:
+                return False
+            self._pending.add(image_path)
+        task = (str(video_path), image_path, frames or self.timeline)
+        while not self._stop.is_set():
+            try:
+                self._queue.put(task, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        with self._lock:
+            self._pending.discard(image_path)
+        return False
+
+    def __run(self):
+        while True:
+            try:
+                task = self._queue.get(timeout=1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            video_path, image_path, frames = task
+            start = time.time()
+            success = False
+            try:
+                if not self._stop.is_set():
+                    success = self.__extract(video_path, image_path, frames)
+                    # 视频比截图时间点短时截取第一帧
+                    if not success and frames != "00:00:00" and not self._stop.is_set():
+                        success = self.__extract(video_path, image_path, "00:00:00")
+            except Exception as e:
+                logger.warn(f"截取视频缩略图：{video_path}，信息：{str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard(image_path)
+                    if success:
+                        self._done += 1
+                    else:
+                        self._failed += 1
+                    self._elapsed += time.time() - start
+                self._queue.task_done()
+
+    @staticmethod
+    def __extract(video_path: str, image_path: str, frames: str) -> bool:
+        """
+        截取一帧，-ss放在-i前面直接定位，不从头解码
+        """
+        result = subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-ss", frames, "-i", video_path,
+                                 "-frames:v", "1", image_path],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=FFMPEG_TIMEOUT)
+        if result.returncode != 0 or not os.path.exists(image_path):
+            message = result.stderr.decode("utf-8", "ignore").strip()
+            if message:
+                logger.warn(f"截取视频缩略图：{video_path}，信息：{message}")
+            return False
+        return True
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待队列中的任务完成
+        :return: 是否全部完成
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while self._queue.unfinished_tasks:
+            if self._stop.is_set() or (deadline and time.time() > deadline):
+                return False
+            time.sleep(0.2)
+        return True
+
+    def stop(self, cancel: bool = True):
+        """
+        停止队列
+        :param cancel: 是否取消等待中的任务，不取消时等待全部完成
+        """
+        if not cancel:
+            self.join()
+        self._stop.set()
+        # 丢弃等待中的任务
+        while True:
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+            except queue.Empty:
+                break
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        with self._lock:
+            self._pending.clear()
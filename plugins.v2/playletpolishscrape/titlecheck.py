@@ -0,0 +1,133 @@
+"""
+文件名整理正则的新旧实现对比，只依赖标准库，不需要安装MoviePilot
+单独运行：python plugins.v2/playletpolishscrape/titlecheck.py
+"""
+import re
+from pathlib import PurePosixPath
+from typing import Any, List
+
+if __package__:
+    from plugins.playletpolishscrape.patterns import TitlePatterns
+else:
+    # 直接运行脚本时不导入插件包，插件包会加载MoviePilot
+    from patterns import TitlePatterns
+
+# 常见的短剧文件路径
+CORPUS = [
+    "/downloads/短剧/【热播】闪婚后傅先生马甲藏不住了（100集）&王格格/01.mp4",
+    "/downloads/短剧/【热播】闪婚后傅先生马甲藏不住了（100集）&王格格/100 大结局.mp4",
+    "/downloads/短剧/1.重生之我在霸总短剧里当保姆(80集)/12.mp4",
+    "/downloads/短剧/2-离婚后我成了首富(62集)&孙樾/番外2.mp4",
+    "/downloads/短剧/离婚后我成了首富(62集)&孙樾/62完结.mp4",
+    "/downloads/短剧/《逆天邪神》第一季/05.mp4",
+    "/downloads/短剧/[新剧]神医下山（全60集）/分集/07.mp4",
+    "/downloads/短剧/神医下山（全60集）/分集/08-1.mp4",
+    "/downloads/短剧/傲世潜龙 80集 马秋元/傲世潜龙 - S01E03.mp4",
+    "/downloads/短剧/傲世潜龙 80集 马秋元/傲世潜龙.S01E04.1080p.mp4",
+    "/downloads/短剧/萌宝来袭：总裁爹地宠上天(91集)/7月12日更新.mp4",
+    "/downloads/短剧/萌宝来袭：总裁爹地宠上天(91集)/余部C边短剧合集 05.mp4",
+    "/downloads/短剧/萌宝来袭：总裁爹地宠上天(91集)/03(2).mp4",
+    "/downloads/短剧/无双战神(100集)徐艺真&刘擎/无双战神 第15集.mp4",
+    "/downloads/短剧/无双战神(100集)徐艺真&刘擎/ep15.mp4",
+    "/downloads/短剧/Zong Cai Jiao Qi/01.mp4",
+    "/downloads/短剧/龙王殿 (50集) 剧情/01-02.mp4",
+    "/downloads/短剧/龙王殿 (50集) 剧情/3-4.mp4",
+    "/downloads/短剧/（合集）我在八零年代当后妈(83集)/合集/我在八零年代当后妈.mp4",
+    "/downloads/短剧/我在八零年代当后妈/我在八零年代当后妈 23.mp4",
+    "/downloads/短剧/天下第一 ~ 逆袭 · 归来/天下第一.逆袭.归来.E05.mp4",
+    "/downloads/短剧/夫人她又美又飒＆新版(88集)/第1话.mp4",
+    "/downloads/短剧/【完结】长相思/长相思(全36集)/36.mp4",
+    "/downloads/短剧/盖世神医/盖世神医-01-高清.mp4",
+]
+
+INVALID_NAME = "^第\\d+[集话]$\n^ep\\d+$\n更新$"
+
+
+class LegacyPatterns:
+    """
+    旧版本的实现：每次调用都重新拆分配置并使用字符串正则
+    """
+
+    def __init__(self, invalid_name: str):
+        self._invalid_name = invalid_name
+
+    def is_invalid_name(self, search_str):
+        invalid_names = [r'^\d*月\d*日', '余部C边短剧合集']
+        if self._invalid_name:
+            invalid_names.extend(self._invalid_name.split("\n"))
+
+        for invalid_name in invalid_names:
+            if re.search(invalid_name, search_str):
+                return True
+
+        return False
+
+    def is_episode_name(self, org_string):
+        return re.search(r'^\d+([.-][0-9a-zA-Z]+)?([.-]\d+)?([集话]|本季完|完结|最终集|大结局)?.?$', org_string) \
+            or re.search(r'^\d+[.-]([0-9a-zA-Z]+)-.*', org_string) \
+            or re.search(r'^[0-9a-zA-Z]*$', org_string) \
+            or self.is_invalid_name(org_string)
+
+    @staticmethod
+    def strip_org_bracket(org_title):
+        org_bracket = re.search(r"\d+.*(\(\d+\))", org_title)
+        return org_title.replace(org_bracket.group(1), "") if org_bracket else None
+
+    @staticmethod
+    def season_episode(org_string):
+        se_match = re.search(r'S(\d+)E(\d+)', org_string)
+        return (int(se_match.group(1)), int(se_match.group(2))) if se_match else None
+
+    @staticmethod
+    def extra_episode(org_string):
+        return re.search(r'番外(\d*)', org_string)
+
+    @staticmethod
+    def episode_number(org_string):
+        ep_match = re.search(r'^(\d+)\b', org_string)
+        if not ep_match:
+            ep_match = re.search(r'(\d+)$', org_string)
+        if not ep_match:
+            ep_match = re.search(r'\((\d+)\)', org_string)
+        return ep_match
+
+
+def samples(paths: List[str]) -> List[str]:
+    """
+    文件名和各级目录名
+    """
+    names = []
+    for path in paths:
+        path = PurePosixPath(path)
+        for name in (path.stem, path.parent.name, path.parent.parent.name):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def _result(value: Any) -> Any:
+    if isinstance(value, re.Match):
+        return value.group(0), value.groups()
+    return value
+
+
+def check_patterns(paths: List[str] = None, invalid_name: str = INVALID_NAME) -> int:
+    """
+    检查新旧实现对文件名和目录名的判断结果一致
+    :return: 检查的名称数，不一致时抛出AssertionError
+    """
+    legacy = LegacyPatterns(invalid_name)
+    patterns = TitlePatterns(invalid_name)
+    names = samples(paths or CORPUS)
+    for name in names:
+        for method in ("is_invalid_name", "strip_org_bracket", "season_episode", "extra_episode",
+                       "episode_number"):
+            old, new = _result(getattr(legacy, method)(name)), _result(getattr(patterns, method)(name))
+            assert old == new, f"{method} 结果不一致：{name}\n旧：{old}\n新：{new}"
+        old, new = bool(legacy.is_episode_name(name)), patterns.is_episode_name(name)
+        assert old == new, f"is_episode_name 结果不一致：{name}\n旧：{old}\n新：{new}"
+    return len(names)
+
+
+if __name__ == "__main__":
+    print(f"{check_patterns()}个文件名和目录名正则结果一致")
@@ -1,21 +1,41 @@
+import heapq
 import os
+import queue
 import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
 
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
-from app.db.transferhistory_oper import TransferHistoryOper
+from sqlalchemy.orm import Session
+from app.db import db_update
+from app.db.models.transferhistory import TransferHistory
 from app.log import logger
 from app.plugins import _PluginBase
 from app.schemas import NotificationType
 from app.core.event import eventmanager
 from app.schemas.types import EventType
 
+from plugins.removelink.data import InodeStore
+from plugins.removelink.matcher import KeywordMatcher
+from plugins.removelink.table import InodeTable
+
 state_lock = threading.Lock()
 
+# 删除事件停止多少秒后开始处理
+DELETE_BATCH_WAIT = 2
+# 一批最多处理的删除事件
+DELETE_BATCH_MAX = 5000
+# 汇总通知中最多列出的文件数
+NOTIFY_MAX_LINES = 10
+# 刮削文件后缀
+SCRAPE_SUFFIXES = [".jpg", ".nfo"]
+# 批量删除历史记录时每条语句的路径数，不超过SQLite的参数个数限制
+HISTORY_BATCH_SIZE = 500
+
 
 class FileMonitorHandler(FileSystemEventHandler):
     """
@@ -27,6 +47,16 @@ class FileMonitorHandler(FileSystemEventHandler):
         self._watch_path = monpath
         self.sync = sync
 
+    def __is_keyword_excluded(self, file_path: Path) -> bool:
+        """
+        是否命中过滤关键字
+        """
+        keyword = self.sync._keyword_matcher.match(str(file_path))
+        if keyword:
+            logger.info(f"{file_path} 命中过滤关键字 {keyword}，不处理")
+            return True
+        return False
+
     def on_created(self, event):
         if event.is_directory:
             return
@@ -34,92 +64,193 @@ class FileMonitorHandler(FileSystemEventHandler):
         if file_path.suffix in [".!qB", ".part", ".mp"]:
             return
         logger.info(f"监测到新增文件：{file_path}")
-        if self.sync.exclude_keywords:
-            for keyword in self.sync.exclude_keywords.split("\n"):
-                if keyword and keyword in str(file_path):
-                    logger.info(f"{file_path} 命中过滤关键字 {keyword}，不处理")
-                    return
+        if self.__is_keyword_excluded(file_path):
+            return
         # 新增文件记录
-        with state_lock:
-            try:
-                self.sync.state_set[str(file_path)] = file_path.stat().st_ino
-            except Exception as e:
-                logger.error(f"新增文件记录失败：{str(e)}")
+        try:
+            self.sync.add_state(file_path)
+        except Exception as e:
+            logger.error(f"新增文件记录失败：{str(e)}")
 
     def on_moved(self, event):
         if event.is_directory:
             return
+        # 移走的文件不再记录
+        self.sync.remove_state(Path(event.src_path))
         file_path = Path(event.dest_path)
         if file_path.suffix in [".!qB", ".part", ".mp"]:
             return
         logger.info(f"监测到新增文件：{file_path}")
-        if self.sync.exclude_keywords:
-            for keyword in self.sync.exclude_keywords.split("\n"):
-                if keyword and keyword in str(file_path):
-                    logger.info(f"{file_path} 命中过滤关键字 {keyword}，不处理")
-                    return
+        if self.__is_keyword_excluded(file_path):
+            return
         # 新增文件记录
-        with state_lock:
-            self.sync.state_set[str(file_path)] = file_path.stat().st_ino
+        try:
+            self.sync.add_state(file_path)
+        except Exception as e:
+            logger.error(f"新增文件记录失败：{str(e)}")
 
     def on_deleted(self, event):
         file_path = Path(event.src_path)
         if event.is_directory:
             # 单独处理文件夹删除触发删除种子
             if self.sync._delete_torrents:
-                # 发送事件
                 logger.info(f"监测到删除文件夹：{file_path}")
-                eventmanager.send_event(
-                    EventType.DownloadFileDeleted, {"src": str(file_path)}
-                )
+                self.sync.handle_deleted(file_path, is_directory=True)
             return
         if file_path.suffix in [".!qB", ".part", ".mp"]:
             return
         logger.info(f"监测到删除文件：{file_path}")
         # 命中过滤关键字不处理
-        if self.sync.exclude_keywords:
-            for keyword in self.sync.exclude_keywords.split("\n"):
-                if keyword and keyword in str(file_path):
-                    logger.info(f"{file_path} 命中过滤关键字 {keyword}，不处理")
-                    return
+        if self.__is_keyword_excluded(file_path):
+            return
         # 删除硬链接文件
         self.sync.handle_deleted(file_path)
 
 
-def updateState(monitor_dirs: List[str]):
+@db_update
+def _delete_history_by_dest(db: Session = None, dests: List[str] = None) -> List[int]:
+    """
+    在一个事务中删除目的路径为dests的所有整理记录
+    :return: 删除的记录ID
+    """
+    history_ids = []
+    dests = list(dests or [])
+    for i in range(0, len(dests), HISTORY_BATCH_SIZE):
+        chunk = dests[i:i + HISTORY_BATCH_SIZE]
+        ids = [row[0] for row in db.query(TransferHistory.id).filter(TransferHistory.dest.in_(chunk)).all()]
+        if ids:
+            db.query(TransferHistory).filter(TransferHistory.id.in_(ids)).delete(synchronize_session=False)
+            history_ids.extend(ids)
+    return history_ids
+
+
+def scanDir(dir_path: str, saved_dirs: Dict[str, Tuple[int, List[str]]]) \
+        -> Optional[Tuple[int, Optional[List[Tuple[str, int, int]]], List[str]]]:
+    """
+    扫描单个目录，每个文件只stat一次
+    :return: (mtime_ns, [(文件名, inode, 链接数)], [子目录])，目录mtime未变化时文件列表为None
+    """
+    try:
+        mtime_ns = os.stat(dir_path).st_mtime_ns
+    except OSError:
+        return None
+    saved = saved_dirs.get(dir_path)
+    if saved and saved[0] == mtime_ns:
+        return mtime_ns, None, saved[1]
+    files = []
+    sub_dirs = []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            sub_dirs.append(entry.path)
+                        continue
+                    # 记录文件inode
+                    file_stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((entry.name, file_stat.st_ino, file_stat.st_nlink))
+    except OSError as e:
+        logger.warn(f"扫描目录 {dir_path} 失败：{str(e)}")
+        return None
+    # mtime离现在太近时，同一时间粒度内的修改无法区分，下次启动仍需重新扫描
+    if time.time_ns() - mtime_ns < 2 * 10 ** 9:
+        mtime_ns = -1
+    return mtime_ns, files, sub_dirs
+
+
+def scanTree(root: str, parent: Optional[str], saved_dirs: Dict[str, Tuple[int, List[str]]],
+             recursive: bool = True) -> Tuple[Dict[str, tuple], List[Tuple[str, str]]]:
+    """
+    扫描目录树
+    :return: {目录: (父目录, mtime_ns, 文件列表)}，不递归时返回未扫描的(子目录, 父目录)
+    """
+    result = {}
+    pending = []
+    stack = [(root, parent)]
+    while stack:
+        dir_path, parent = stack.pop()
+        if dir_path in result:
+            continue
+        scanned = scanDir(dir_path, saved_dirs)
+        if not scanned:
+            continue
+        mtime_ns, files, sub_dirs = scanned
+        result[dir_path] = (parent, mtime_ns, files)
+        if recursive:
+            stack.extend((sub_dir, dir_path) for sub_dir in sub_dirs)
+        else:
+            pending.extend((sub_dir, dir_path) for sub_dir in sub_dirs)
+    return result, pending
+
+
+def updateState(monitor_dirs: List[str], store: Optional[InodeStore] = None, max_workers: int = 8):
     """
     更新监控目录的文件列表
+    监控目录及其一级子目录分发到线程池并行扫描，网络挂载的目录主要耗时在等待IO上
+    有保存的记录时，只重新扫描mtime发生变化的目录，其余目录直接使用保存的记录
+    未变化目录中文件的链接数取自保存的记录，可能已经过时，只用于统计
     """
     # 记录开始时间
     start_time = time.time()
-    state_set = {}
-    for mon_path in monitor_dirs:
-        for root, dirs, files in os.walk(mon_path):
-            for file in files:
-                file = Path(root) / file
-                if not file.exists():
-                    continue
-                # 记录文件inode
-                inode = file.stat().st_ino
-                old_info = state_set.get(inode)
-                if old_info:
-                    state_set[inode]["path"].append(str(file))
-                else:
-                    state_set[inode] = {
-                        "path": [str(file)],
-                        "num": file.stat().st_nlink
-                    }
+    state_set = InodeTable()
+    # 上次保存的目录信息
+    saved_dirs = store.load_dirs() if store else {}
+    # 扫描到的所有目录
+    all_dirs = {}
+    # 目录按规范化后的路径记录，和事件路径拆分出的目录一致，配置的目录末尾可能有/
+    mon_paths = [os.path.normpath(mon_path) for mon_path in monitor_dirs if mon_path]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # 先扫描监控目录本身，再把一级子目录分发到线程池
+        pending = []
+        for result, sub_dirs in executor.map(lambda p: scanTree(p, None, saved_dirs, recursive=False), mon_paths):
+            all_dirs.update(result)
+            pending.extend(sub_dirs)
+        submitted = set()
+        futures = []
+        for sub_dir, parent in pending:
+            if sub_dir in all_dirs or sub_dir in submitted:
+                continue
+            submitted.add(sub_dir)
+            futures.append(executor.submit(scanTree, sub_dir, parent, saved_dirs))
+        for future in as_completed(futures):
+            result, _ = future.result()
+            for dir_path, info in result.items():
+                all_dirs.setdefault(dir_path, info)
+
+    # 未变化的目录
+    unchanged_dirs = set()
+    # 重新扫描的目录
+    scanned_dirs = []
+    scanned_file_cnt = 0
+    for dir_path, (parent, mtime_ns, files) in all_dirs.items():
+        if files is None:
+            unchanged_dirs.add(dir_path)
+            continue
+        scanned_dirs.append((dir_path, parent, mtime_ns, files))
+        scanned_file_cnt += len(files)
+        for name, inode, nlink in files:
+            state_set.add_entry(dir_path, name, inode, nlink)
+    if store and unchanged_dirs:
+        for dir_path, name, inode, nlink in store.iter_files():
+            if dir_path in unchanged_dirs:
+                state_set.add_entry(dir_path, name, inode, nlink)
+    if store:
+        store.save(scanned_dirs, [dir_path for dir_path in saved_dirs if dir_path not in all_dirs])
+
     # 记录结束时间
     end_time = time.time()
     # 计算耗时
     elapsed_time = end_time - start_time
 
-    miss_link_cnt = 0
-    for _, info in state_set.items():
-        if len(info.get("path")) < info.get("num"):
-            miss_link_cnt += 1
+    miss_link_cnt = state_set.miss_link_count()
 
-    logger.info(f"更新文件列表完成，共计{len(state_set)}个文件，有{miss_link_cnt}个未能找完硬链接文件，耗时：{elapsed_time}秒")
+    logger.info(f"更新文件列表完成，共计{len(state_set)}个文件，有{miss_link_cnt}个未能找完硬链接文件，"
+                f"重新扫描{len(scanned_dirs)}个目录{scanned_file_cnt}个文件"
+                f"（{scanned_file_cnt / elapsed_time if elapsed_time else 0:.0f}个/秒），"
+                f"{len(unchanged_dirs)}个目录未变化，耗时：{elapsed_time}秒")
 
     return state_set
 
@@ -132,7 +263,7 @@ class RemoveLink(_PluginBase):
     # 插件图标
     plugin_icon = "Ombi_A.png"
     # 插件版本
-    plugin_version = "2.3"
+    plugin_version = "2.3.10"
     # 插件作者
     plugin_author = "DzAvril,hyuan280"
     # 作者主页
@@ -157,7 +288,19 @@ class RemoveLink(_PluginBase):
     _observer = []
     _rename_conf = {}
     # 监控目录的文件列表
-    state_set: Dict[int, dict] = {}
+    state_set: InodeTable = InodeTable()
+    # inode记录持久化
+    _store: Optional[InodeStore] = None
+    # 删除事件队列
+    _delete_queue: Optional[queue.Queue] = None
+    _delete_worker: Optional[threading.Thread] = None
+    # 插件自己删除的硬链接文件，收到删除事件时跳过
+    _self_deleted = set()
+    # 退出事件
+    _event = threading.Event()
+    # 编译后的过滤关键字和不删除目录
+    _keyword_matcher = KeywordMatcher([])
+    _exclude_dir_matcher = KeywordMatcher([])
 
     def init_plugin(self, config: dict = None):
         logger.info(f"Hello, RemoveLink! config {config}")
@@ -171,16 +314,23 @@ class RemoveLink(_PluginBase):
             self._delete_scrap_infos = config.get("delete_scrap_infos")
             self._delete_torrents = config.get("delete_torrents")
             self._delete_history = config.get("delete_history")
+        self._keyword_matcher = KeywordMatcher(self.exclude_keywords.split("\n"))
+        self._exclude_dir_matcher = KeywordMatcher(self.exclude_dirs.split("\n"))
 
         # 停止现有任务
         self.stop_service()
 
         if self._enabled:
             # 读取目录配置
-            monitor_dirs = self.monitor_dirs.split("\n")
+            monitor_dirs = [os.path.normpath(mon_path) for mon_path in self.monitor_dirs.split("\n") if mon_path]
             logger.info(f"监控目录：{monitor_dirs}")
             if not monitor_dirs:
                 return
+            # 启动删除处理线程
+            self._delete_queue = queue.Queue()
+            self._self_deleted = set()
+            self._delete_worker = threading.Thread(target=self.__delete_worker, daemon=True)
+            self._delete_worker.start()
             for mon_path in monitor_dirs:
                 # 格式源目录:目的目录
                 if not mon_path:
@@ -208,7 +358,9 @@ class RemoveLink(_PluginBase):
             # 更新监控集合
             with state_lock:
                 try:
-                    self.state_set = updateState(monitor_dirs)
+                    if not self._store:
+                        self._store = InodeStore(str(self.get_data_path()))
+                    self.state_set = updateState(monitor_dirs, self._store)
                 except Exception as e:
                     logger.error(f"hyuan fail：{str(e)}")
 
@@ -477,190 +629,256 @@ class RemoveLink(_PluginBase):
                     print(str(e))
                     logger.error(f"停止目录监控失败：{str(e)}")
         self._observer = []
+        # 处理完队列中剩余的删除事件
+        if self._delete_worker:
+            self._event.set()
+            self._delete_worker.join()
+            self._event.clear()
+        self._delete_worker = None
+        self._delete_queue = None
+
+    def add_state(self, file_path: Path):
+        """
+        新增文件记录
+        """
+        file_stat = file_path.stat()
+        with state_lock:
+            self.state_set.add(str(file_path), file_stat.st_ino, file_stat.st_nlink)
 
-    def __is_excluded(self, file_path: Path) -> bool:
+    def remove_state(self, file_path: Path):
         """
-        是否排除目录
+        移除文件记录
         """
-        for exclude_dir in self.exclude_dirs.split("\n"):
-            if exclude_dir and exclude_dir in str(file_path):
-                return True
-        return False
+        with state_lock:
+            self.state_set.remove(str(file_path))
 
-    @staticmethod
-    def scrape_files_left(path):
+    def __is_excluded(self, file_path: Path) -> bool:
         """
-        检查path目录是否只包含刮削文件
+        是否排除目录
         """
-        # 检查path下是否有目录
-        for dir_path in os.listdir(path):
-            if os.path.isdir(os.path.join(path, dir_path)):
-                return False
-
-        # 检查path下是否有非刮削文件
-        for file in path.iterdir():
-            if not file.suffix.lower() in [
-                ".jpg",
-                ".nfo",
-            ]:
-                return False
-        return True
-
-    def delete_scrap_infos(self, path):
+        return self._exclude_dir_matcher.match(str(file_path)) is not None
+
+    def delete_scrap_infos(self, paths: List[Path]) -> List[Path]:
         """
-        清理path相关的刮削文件
+        清理paths相关的刮削文件，再从下往上逐级检测并删除空目录，直到遇到非空目录或到达指定监控目录为止
+        同一批文件中每个目录只读取一次
+        :return: 清理的空目录
         """
         if not self._delete_scrap_infos:
-            return
-        # 文件所在目录已被删除则退出
-        if not os.path.exists(path.parent):
-            return
-        try:
-            if not path.suffix.lower() in [
-                ".jpg",
-                ".nfo",
-            ]:
-                # 清理与path相关的刮削文件
-                name_prefix = path.stem
-                for file in path.parent.iterdir():
-                    if file.name.startswith(name_prefix):
-                        file.unlink()
-                        logger.info(f"删除刮削文件：{file}")
-        except Exception as e:
-            logger.error(f"清理刮削文件发生错误：{str(e)}.")
-        # 清理空目录
-        self.delete_empty_folders(path)
+            return []
+        # 目录下的文件名 => 是否为目录
+        listings: Dict[Path, Optional[Dict[str, bool]]] = {}
+
+        def list_dir(dir_path: Path) -> Optional[Dict[str, bool]]:
+            if dir_path not in listings:
+                try:
+                    with os.scandir(dir_path) as entries:
+                        listings[dir_path] = {entry.name: entry.is_dir() for entry in entries}
+                except OSError:
+                    listings[dir_path] = None
+            return listings[dir_path]
+
+        def unlink(dir_path: Path, name: str):
+            file = dir_path / name
+            try:
+                file.unlink()
+                listings[dir_path].pop(name, None)
+                logger.info(f"删除刮削文件：{file}")
+            except Exception as e:
+                logger.error(f"清理刮削文件发生错误：{str(e)}.")
 
-    def delete_history(self, path):
+        # 需要检查是否为空的目录
+        check_dirs = set()
+        for path in paths:
+            listing = list_dir(path.parent)
+            # 文件所在目录已被删除则跳过
+            if listing is None:
+                continue
+            check_dirs.add(path.parent)
+            if path.suffix.lower() in SCRAPE_SUFFIXES:
+                continue
+            # 清理与path相关的刮削文件
+            name_prefix = path.stem
+            for name in [name for name, is_dir in listing.items() if not is_dir and name.startswith(name_prefix)]:
+                unlink(path.parent, name)
+
+        # 从最深的目录开始检查，子目录删除后再检查父目录
+        monitor_dirs = {Path(mon_path) for mon_path in self.monitor_dirs.split("\n") if mon_path}
+        removed_dirs = []
+        heap = [(-len(dir_path.parts), str(dir_path)) for dir_path in check_dirs]
+        heapq.heapify(heap)
+        while heap:
+            _, dir_path = heapq.heappop(heap)
+            dir_path = Path(dir_path)
+            if self.__is_excluded(dir_path):
+                continue
+            # 如果当前路径等于监控目录之一，停止向上检查
+            if dir_path in monitor_dirs:
+                continue
+            listing = list_dir(dir_path)
+            # 已被删除则停止向上检查
+            if listing is None:
+                continue
+            # 若目录下只剩刮削文件，则清空文件夹
+            if not any(listing.values()) \
+                    and all(os.path.splitext(name)[1].lower() in SCRAPE_SUFFIXES for name in listing):
+                for name in list(listing):
+                    unlink(dir_path, name)
+            if listing:
+                continue
+            try:
+                os.rmdir(dir_path)
+            except Exception as e:
+                logger.error(f"清理空目录发生错误：{str(e)}")
+                continue
+            logger.info(f"清理空目录：{dir_path}")
+            removed_dirs.append(dir_path)
+            listings[dir_path] = None
+            if listings.get(dir_path.parent) is not None:
+                listings[dir_path.parent].pop(dir_path.name, None)
+            if dir_path.parent not in check_dirs:
+                check_dirs.add(dir_path.parent)
+                heapq.heappush(heap, (-len(dir_path.parent.parts), str(dir_path.parent)))
+        return removed_dirs
+
+    def delete_history(self, paths: List[Path]):
         """
-        清理path相关的历史记录
+        批量清理paths相关的历史记录
         """
         if not self._delete_history:
             return
-        monitor_dirs = self.monitor_dirs.split("\n")
-
-        # 查找历史记录
-        _transferhistory = TransferHistoryOper()
-        transfer_history = _transferhistory.get_by_dest(path)
-        if transfer_history:
-            # 删除历史记录
-            _transferhistory.delete(transfer_history.id)
-            logger.info(f"删除历史记录：{transfer_history.id}")
-
-        
-        if self._rename_conf:
+        dests = set()
+        for path in paths:
+            path = str(path)
+            dests.add(path)
             for now, tidy in self._rename_conf.items():
                 if now in path:
-                    rename_path = path.replace(now, tidy)
-                    transfer_history = _transferhistory.get_by_dest(rename_path)
-                    if transfer_history:
-                        # 删除历史记录
-                        _transferhistory.delete(transfer_history.id)
-                        logger.info(f"删除历史记录：{transfer_history.id}")
+                    dests.add(path.replace(now, tidy))
                     break
 
-    def delete_empty_folders(self, path):
+        # db_update只在传入db参数或位置参数时注入会话
+        try:
+            history_ids = _delete_history_by_dest(db=None, dests=sorted(dests))
+        except Exception as e:
+            logger.error(f"删除历史记录失败：{str(e)}")
+            return
+        if history_ids:
+            logger.info(f"删除历史记录{len(history_ids)}条")
+            logger.debug(f"删除的历史记录：{sorted(history_ids)}")
+
+    def handle_deleted(self, file_path: Path, is_directory: bool = False):
         """
-        从指定路径开始，逐级向上层目录检测并删除空目录，直到遇到非空目录或到达指定监控目录为止
+        处理删除事件，放入队列后立即返回，由后台线程批量处理
         """
-        # logger.info(f"清理空目录: {path}")
-        while True:
-            parent_path = path.parent
-            if self.__is_excluded(parent_path):
-                break
-            # parent_path如已被删除则退出检查
-            if not os.path.exists(parent_path):
-                break
-            # 如果当前路径等于监控目录之一，停止向上检查
-            if parent_path in self.monitor_dirs.split("\n"):
-                break
-
-            # 若目录下只剩刮削文件，则清空文件夹
-            try:
-                if self.scrape_files_left(parent_path):
-                    # 清除目录下所有文件
-                    for file in parent_path.iterdir():
-                        file.unlink()
-                        logger.info(f"删除刮削文件：{file}")
-            except Exception as e:
-                logger.error(f"清理刮削文件发生错误：{str(e)}.")
+        if self._delete_queue is None:
+            return
+        self._delete_queue.put((file_path, is_directory))
 
+    def __delete_worker(self):
+        """
+        后台处理删除事件，连续的删除事件（比如删除整个目录）合并为一批处理
+        """
+        while not self._event.is_set() or not self._delete_queue.empty():
             try:
-                if not os.listdir(parent_path):
-                    os.rmdir(parent_path)
-                    logger.info(f"清理空目录：{parent_path}")
-                    if self._notify:
-                        self.post_message(
-                            mtype=NotificationType.SiteMessage,
-                            title=f"【清理硬链接】",
-                            text=f"清理空文件夹：[{parent_path}]\n",
-                        )
-                else:
+                batch = [self._delete_queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            # 等待删除事件停止
+            while len(batch) < DELETE_BATCH_MAX:
+                try:
+                    batch.append(self._delete_queue.get(timeout=DELETE_BATCH_WAIT))
+                except queue.Empty:
                     break
+            try:
+                self.__handle_batch(batch)
             except Exception as e:
-                logger.error(f"清理空目录发生错误：{str(e)}")
-
-            # 更新路径为父目录，准备下一轮检查
-            path = parent_path
+                logger.error(
+                    "删除硬链接文件发生错误：%s - %s" % (str(e), traceback.format_exc())
+                )
 
-    def handle_deleted(self, file_path: Path):
+    def __handle_batch(self, batch: List[Tuple[Path, bool]]):
         """
-        处理删除事件
+        处理一批删除事件
         """
+        dir_paths = []
+        file_paths = []
+        for file_path, is_directory in batch:
+            if is_directory:
+                dir_paths.append(file_path)
+                continue
+            # 插件自己删除的硬链接文件已经处理过
+            if str(file_path) in self._self_deleted:
+                self._self_deleted.discard(str(file_path))
+                continue
+            if file_path not in file_paths:
+                file_paths.append(file_path)
+        if file_paths:
+            logger.info(f"开始处理{len(file_paths)}个删除的文件")
+
         # 删除的文件对应的监控信息
+        deleted_links = {}
         with state_lock:
-            # 清理刮削文件
-            self.delete_scrap_infos(file_path)
-            if self._delete_torrents:
-                # 发送事件
-                eventmanager.send_event(
-                    EventType.DownloadFileDeleted, {"src": str(file_path)}
-                )
-            # 删除源文件历史记录
-            self.delete_history(str(file_path))
-            # 删除的文件inode
-            deleted_inode = 0
-            for inode, info in self.state_set.items():
-                if str(file_path) in info.get("path"):
-                    deleted_inode = inode
-                    break
-
-            deleted_inode_info = self.state_set.get(deleted_inode)
-            if not deleted_inode_info:
-                logger.debug(f"文件 {file_path} 未在监控列表中，可能已经处理过")
-                return
-            else:
-                self.state_set.pop(deleted_inode)
-            try:
-                # 在current_set中查找与deleted_inode有相同inode的文件并删除
-                for path in deleted_inode_info.get("path"):
-                    if path == str(file_path):
-                        continue
-                    file = Path(path)
-                    if self.__is_excluded(file):
-                        logger.debug(f"文件 {file} 在不删除目录中，不处理")
-                        continue
+            for file_path in file_paths:
+                deleted_inode = self.state_set.inode_of(str(file_path))
+                if deleted_inode is None:
+                    logger.debug(f"文件 {file_path} 未在监控列表中，可能已经处理过")
+                    continue
+                deleted_links[file_path] = (deleted_inode,
+                                            self.state_set.nlink_of(deleted_inode),
+                                            self.state_set.pop_inode(deleted_inode))
 
-                    # 删除硬链接文件
-                    logger.info(f"删除硬链接文件：{path}， inode: {deleted_inode}")
+        # 删除硬链接文件
+        deleted_files = list(file_paths)
+        linked_files = []
+        kept_files = []
+        for file_path, (deleted_inode, nlink, paths) in deleted_links.items():
+            for path in paths:
+                if path == str(file_path):
+                    continue
+                file = Path(path)
+                if self.__is_excluded(file):
+                    logger.debug(f"文件 {file} 在不删除目录中，不处理")
+                    kept_files.append((path, deleted_inode, nlink))
+                    continue
+                logger.info(f"删除硬链接文件：{path}， inode: {deleted_inode}")
+                self._self_deleted.add(path)
+                try:
                     file.unlink()
-                    # 清理刮削文件
-                    self.delete_scrap_infos(path)
-                    if self._delete_torrents:
-                        # 发送事件
-                        eventmanager.send_event(
-                            EventType.DownloadFileDeleted, {"src": str(file_path)}
-                        )
-                    # 删除硬链接文件历史记录
-                    self.delete_history(path)
-                    if self._notify:
-                        self.post_message(
-                            mtype=NotificationType.SiteMessage,
-                            title=f"【清理硬链接】",
-                            text=f"监控到删除源文件：[{file_path}]\n"
-                                    f"同步删除硬链接文件：[{path}]",
-                        )
-            except Exception as e:
-                logger.error(
-                    "删除硬链接文件发生错误：%s - %s" % (str(e), traceback.format_exc())
+                except Exception as e:
+                    self._self_deleted.discard(path)
+                    logger.error(f"删除硬链接文件 {path} 失败：{str(e)}")
+                    continue
+                deleted_files.append(file)
+                linked_files.append((file_path, file))
+        # 不删除目录中的文件继续监控
+        if kept_files:
+            with state_lock:
+                for path, inode, nlink in kept_files:
+                    self.state_set.add(path, inode, nlink)
+
+        # 清理刮削文件和空目录
+        removed_dirs = self.delete_scrap_infos(deleted_files)
+        if self._delete_torrents:
+            # 发送事件
+            for path in dir_paths + file_paths:
+                eventmanager.send_event(
+                    EventType.DownloadFileDeleted, {"src": str(path)}
                 )
+        # 删除历史记录
+        self.delete_history(deleted_files)
+
+        if self._notify and (linked_files or removed_dirs):
+            text = f"监控到删除源文件{len(file_paths)}个，同步删除硬链接文件{len(linked_files)}个\n"
+            for file_path, file in linked_files[:NOTIFY_MAX_LINES]:
+                text += f"[{file_path}] => [{file}]\n"
+            if len(linked_files) > NOTIFY_MAX_LINES:
+                text += f"等{len(linked_files)}个文件\n"
+            if removed_dirs:
+                text += f"清理空文件夹{len(removed_dirs)}个\n"
+                for dir_path in removed_dirs[:NOTIFY_MAX_LINES]:
+                    text += f"[{dir_path}]\n"
+            self.post_message(
+                mtype=NotificationType.SiteMessage,
+                title=f"【清理硬链接】",
+                text=text.strip(),
+            )
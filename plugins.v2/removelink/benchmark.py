@@ -0,0 +1,216 @@
+"""
+文件列表扫描性能对比
+在MoviePilot目录下运行：python -m plugins.removelink.benchmark --dirs 200 --files 100
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import List, Dict, Union
+
+from sqlalchemy import event
+
+from app.db import Engine, SessionFactory
+from app.db.models.transferhistory import TransferHistory
+
+from plugins.removelink import HISTORY_BATCH_SIZE, RemoveLink, updateState
+from plugins.removelink.data import InodeStore
+from plugins.removelink.table import InodeTable
+
+
+def legacy_update_state(monitor_dirs: List[str]) -> Dict[int, dict]:
+    """
+    旧版本的扫描方式：os.walk，每个文件Path.exists()和两次stat()
+    """
+    state_set = {}
+    for mon_path in monitor_dirs:
+        for root, dirs, files in os.walk(mon_path):
+            for file in files:
+                file = Path(root) / file
+                if not file.exists():
+                    continue
+                inode = file.stat().st_ino
+                old_info = state_set.get(inode)
+                if old_info:
+                    state_set[inode]["path"].append(str(file))
+                else:
+                    state_set[inode] = {
+                        "path": [str(file)],
+                        "num": file.stat().st_nlink
+                    }
+    return state_set
+
+
+def build_tree(root: str, dir_cnt: int, file_cnt: int, link_ratio: float) -> List[str]:
+    """
+    生成测试目录：下载目录和媒体库目录，媒体库中按比例硬链接下载目录的文件
+    :return: 监控目录
+    """
+    download_dir = os.path.join(root, "downloads")
+    library_dir = os.path.join(root, "library")
+    index = 0
+    for i in range(dir_cnt):
+        src_dir = os.path.join(download_dir, f"show{i}", "Season 1")
+        dest_dir = os.path.join(library_dir, f"show{i}", "Season 1")
+        os.makedirs(src_dir)
+        os.makedirs(dest_dir)
+        for j in range(file_cnt):
+            src_file = os.path.join(src_dir, f"show{i}.S01E{j:03d}.mkv")
+            with open(src_file, "wb"):
+                pass
+            if int((index + 1) * link_ratio) > int(index * link_ratio):
+                os.link(src_file, os.path.join(dest_dir, f"show{i} - S01E{j:03d}.mkv"))
+            index += 1
+    return [download_dir, library_dir]
+
+
+def normalize(state_set: Union[Dict[int, dict], InodeTable]) -> Dict[int, tuple]:
+    """
+    统一两种记录的格式
+    """
+    if isinstance(state_set, InodeTable):
+        return {inode: (sorted(paths), nlink) for inode, paths, nlink in state_set.items()}
+    return {inode: (sorted(info["path"]), info["num"]) for inode, info in state_set.items()}
+
+
+def summary(state_set: Union[Dict[int, dict], InodeTable], elapsed: float) -> str:
+    """
+    统计文件数、每秒文件数和未找完硬链接的文件数
+    """
+    infos = normalize(state_set).values()
+    file_cnt = sum(len(paths) for paths, _ in infos)
+    miss_link_cnt = sum(1 for paths, nlink in infos if len(paths) < nlink)
+    return f"{file_cnt}个文件，{file_cnt / elapsed if elapsed else 0:.0f}个/秒，" \
+           f"{miss_link_cnt}个未能找完硬链接，耗时{elapsed:.3f}秒"
+
+
+def memory_usage(state_set: Union[Dict[int, dict], InodeTable]) -> str:
+    """
+    重新生成一份相同的记录，统计占用的内存
+    """
+    items = list(normalize(state_set).items())
+    tracemalloc.start()
+    if isinstance(state_set, InodeTable):
+        copied = InodeTable()
+        for inode, (paths, nlink) in items:
+            for path in paths:
+                copied.add(path, inode, nlink)
+    else:
+        copied = {}
+        for inode, (paths, nlink) in items:
+            copied[inode] = {
+                "path": [str(Path(path)) for path in paths],
+                "num": nlink
+            }
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del copied
+    return f"{memory / 1024 / 1024:.1f}MB"
+
+
+def check_trailing_slash(root: str):
+    """
+    监控目录配置末尾有/时，监控目录下的文件也能找到，再次启动时使用保存的记录
+    """
+    mon_path = os.path.join(root, "trailing")
+    os.makedirs(os.path.join(mon_path, "sub"))
+    for name in ("top", os.path.join("sub", "nested")):
+        with open(os.path.join(mon_path, name), "wb"):
+            pass
+    store = InodeStore(os.path.join(root, "trailing_data"))
+    for _ in range(2):
+        state = updateState([mon_path + "/"], store)
+        for name in ("top", os.path.join("sub", "nested")):
+            assert state.inode_of(os.path.join(mon_path, name)) is not None, f"未找到监控目录下的文件：{name}"
+        # 等待目录mtime超过判定窗口，第二次启动使用保存的记录
+        time.sleep(2.1)
+    assert set(store.load_dirs()) == {mon_path, os.path.join(mon_path, "sub")}, "保存的目录和扫描的目录不一致"
+    print("监控目录末尾有/时扫描结果正确")
+
+
+def check_history_batch(root: str, file_cnt: int = 2000):
+    """
+    一批删除多个文件时，历史记录在一个事务中按批查询和删除
+    测试记录的路径在临时目录下，检查后已被删除
+    """
+    dests = [os.path.join(root, "history", f"show - S01E{i:04d}.mkv") for i in range(file_cnt)]
+    with SessionFactory() as db:
+        db.add_all([TransferHistory(src=dest, dest=dest) for dest in dests])
+        db.commit()
+    statements = []
+    commits = []
+
+    def on_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def on_commit(conn):
+        commits.append(conn)
+
+    plugin = RemoveLink()
+    plugin._delete_history = True
+    plugin._rename_conf = {}
+    event.listen(Engine, "before_cursor_execute", on_execute)
+    event.listen(Engine, "commit", on_commit)
+    try:
+        plugin.delete_history([Path(dest) for dest in dests])
+    finally:
+        event.remove(Engine, "before_cursor_execute", on_execute)
+        event.remove(Engine, "commit", on_commit)
+    with SessionFactory() as db:
+        left = db.query(TransferHistory).filter(TransferHistory.dest.in_(dests[:HISTORY_BATCH_SIZE])).count()
+    assert left == 0, f"还有{left}条历史记录未删除"
+    # 每批一次查询、一次删除
+    max_statements = 2 * -(-file_cnt // HISTORY_BATCH_SIZE)
+    assert len(statements) <= max_statements, f"删除{file_cnt}个文件的历史记录执行了{len(statements)}条语句"
+    assert len(commits) == 1, f"删除历史记录提交了{len(commits)}次"
+    print(f"删除{file_cnt}个文件的历史记录：{len(statements)}条语句，{len(commits)}次提交")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="清理硬链接 文件列表扫描性能对比")
+    parser.add_argument("--root", help="生成测试目录的位置，测试网络挂载时指定到挂载目录下")
+    parser.add_argument("--dirs", type=int, default=200, help="剧集目录数量")
+    parser.add_argument("--files", type=int, default=100, help="每个目录的文件数量")
+    parser.add_argument("--link-ratio", type=float, default=0.8, help="被硬链接到媒体库的文件比例")
+    parser.add_argument("--workers", type=int, default=8, help="扫描线程数")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="removelink_bench_", dir=args.root)
+    try:
+        check_trailing_slash(root)
+        check_history_batch(root)
+        monitor_dirs = build_tree(root, args.dirs, args.files, args.link_ratio)
+        # 只监控媒体库，产生未找完硬链接的文件
+        partial_dirs = monitor_dirs[1:]
+
+        start = time.time()
+        old_state = legacy_update_state(monitor_dirs)
+        print(f"os.walk扫描：{summary(old_state, time.time() - start)}，内存{memory_usage(old_state)}")
+
+        start = time.time()
+        new_state = updateState(monitor_dirs, max_workers=args.workers)
+        print(f"scandir并行扫描：{summary(new_state, time.time() - start)}，内存{memory_usage(new_state)}")
+        assert normalize(old_state) == normalize(new_state), "扫描结果不一致"
+
+        start = time.time()
+        partial_state = updateState(partial_dirs, max_workers=args.workers)
+        print(f"只扫描媒体库：{summary(partial_state, time.time() - start)}")
+
+        store = InodeStore(os.path.join(root, "data"))
+        updateState(monitor_dirs, store, max_workers=args.workers)
+        # 等待目录mtime超过判定窗口
+        time.sleep(2.1)
+        updateState(monitor_dirs, store, max_workers=args.workers)
+        start = time.time()
+        warm_state = updateState(monitor_dirs, store, max_workers=args.workers)
+        print(f"使用保存的记录启动：{summary(warm_state, time.time() - start)}")
+        assert normalize(old_state) == normalize(warm_state), "扫描结果不一致"
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
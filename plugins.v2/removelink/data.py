@@ -0,0 +1,130 @@
+"""
+数据管理模块
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Iterator, Iterable
+
+from app.log import logger
+
+
+class InodeStore:
+    """
+    监控目录inode记录的持久化，使用sqlite保存每个目录的mtime和目录下文件的inode
+    """
+
+    def __init__(self, data_path: str):
+        """
+        初始化数据管理
+        :param data_path: 数据目录路径
+        """
+        self.data_path = data_path
+        self.data_file = os.path.join(data_path, "inode_state.db")
+        self.__init_db()
+
+    @contextmanager
+    def __connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        每次操作单独连接，避免跨线程使用同一个连接
+        """
+        conn = sqlite3.connect(self.data_file)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __init_db(self):
+        """
+        创建数据表
+        """
+        try:
+            os.makedirs(self.data_path, exist_ok=True)
+            with self.__connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS dirs ("
+                             "id INTEGER PRIMARY KEY, "
+                             "path TEXT UNIQUE NOT NULL, "
+                             "parent TEXT, "
+                             "mtime_ns INTEGER NOT NULL)")
+                conn.execute("CREATE TABLE IF NOT EXISTS files ("
+                             "dir_id INTEGER NOT NULL, "
+                             "name TEXT NOT NULL, "
+                             "inode INTEGER NOT NULL, "
+                             "nlink INTEGER NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir_id)")
+        except Exception as e:
+            logger.error(f"初始化inode数据库失败: {str(e)}")
+
+    def load_dirs(self) -> Dict[str, Tuple[int, List[str]]]:
+        """
+        读取保存的目录信息
+        :return: {目录: (mtime_ns, [子目录])}
+        """
+        dirs = {}
+        try:
+            with self.__connect() as conn:
+                rows = conn.execute("SELECT path, parent, mtime_ns FROM dirs").fetchall()
+        except Exception as e:
+            logger.error(f"读取inode数据库失败: {str(e)}")
+            return dirs
+        for path, _, mtime_ns in rows:
+            dirs[path] = (mtime_ns, [])
+        for path, parent, _ in rows:
+            if parent in dirs:
+                dirs[parent][1].append(path)
+        return dirs
+
+    def iter_files(self) -> Iterator[Tuple[str, str, int, int]]:
+        """
+        遍历保存的文件信息
+        :return: (目录, 文件名, inode, 链接数)
+        """
+        try:
+            with self.__connect() as conn:
+                cursor = conn.execute("SELECT dirs.path, files.name, files.inode, files.nlink "
+                                      "FROM files JOIN dirs ON files.dir_id = dirs.id")
+                for row in cursor:
+                    yield row
+        except Exception as e:
+            logger.error(f"读取inode数据库失败: {str(e)}")
+
+    def save(self, scanned: Iterable[Tuple[str, str, int, List[Tuple[str, int, int]]]],
+             removed: Iterable[str]) -> bool:
+        """
+        保存重新扫描的目录，删除已经不存在的目录
+        :param scanned: [(目录, 父目录, mtime_ns, [(文件名, inode, 链接数)])]
+        :param removed: 不存在的目录
+        :return: 是否成功
+        """
+        try:
+            with self.__connect() as conn:
+                for path in removed:
+                    conn.execute("DELETE FROM files WHERE dir_id IN (SELECT id FROM dirs WHERE path = ?)", (path,))
+                    conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+                for path, parent, mtime_ns, files in scanned:
+                    conn.execute("INSERT INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?) "
+                                 "ON CONFLICT(path) DO UPDATE SET parent = excluded.parent, "
+                                 "mtime_ns = excluded.mtime_ns", (path, parent, mtime_ns))
+                    dir_id = conn.execute("SELECT id FROM dirs WHERE path = ?", (path,)).fetchone()[0]
+                    conn.execute("DELETE FROM files WHERE dir_id = ?", (dir_id,))
+                    conn.executemany("INSERT INTO files (dir_id, name, inode, nlink) VALUES (?, ?, ?, ?)",
+                                     ((dir_id, name, inode, nlink) for name, inode, nlink in files))
+            return True
+        except Exception as e:
+            logger.error(f"保存inode数据库失败: {str(e)}")
+            return False
+
+    def clear_all_data(self) -> bool:
+        """
+        清空所有数据
+        :return: 是否成功
+        """
+        try:
+            with self.__connect() as conn:
+                conn.execute("DELETE FROM files")
+                conn.execute("DELETE FROM dirs")
+            return True
+        except Exception as e:
+            logger.error(f"清空inode数据库失败: {str(e)}")
+            return False
@@ -0,0 +1,79 @@
+"""
+关键字匹配
+"""
+from typing import Dict, Iterable, List, Optional
+
+
+class KeywordMatcher:
+    """
+    子串匹配，配置时编译一次，匹配时只扫描一遍文本
+    关键字较多时使用Aho–Corasick自动机，耗时和关键字数量无关
+    """
+    # 关键字不多时逐个用 in 查找，在Python中比逐字符走自动机快
+    _LINEAR_MAX = 8
+
+    def __init__(self, keywords: Iterable[str]):
+        # 去掉空行和重复的关键字，保持配置顺序
+        self.keywords = tuple(dict.fromkeys(keyword for keyword in keywords if keyword))
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Optional[str]] = [None]
+        if len(self.keywords) > self._LINEAR_MAX:
+            self.__build()
+
+    def __bool__(self) -> bool:
+        return bool(self.keywords)
+
+    def __build(self):
+        """
+        构建自动机
+        """
+        goto, output = self._goto, self._output
+        for keyword in self.keywords:
+            state = 0
+            for ch in keyword:
+                next_state = goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][ch] = next_state
+                    goto.append({})
+                    output.append(None)
+                state = next_state
+            if output[state] is None:
+                output[state] = keyword
+        # 按层次计算失败指针
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(ch, 0)
+                # 失败指针上的关键字也在这里结束
+                if output[next_state] is None:
+                    output[next_state] = output[fail[next_state]]
+        self._fail = fail
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        查找text中包含的关键字
+        :return: 命中的关键字，没有命中返回None
+        """
+        if not self.keywords:
+            return None
+        if len(self.keywords) <= self._LINEAR_MAX:
+            for keyword in self.keywords:
+                if keyword in text:
+                    return keyword
+            return None
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
@@ -0,0 +1,383 @@
+"""
+紧凑的inode记录表
+"""
+import os
+import random
+from array import array
+from typing import Callable, Dict, List, Optional, Iterator, Tuple
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+# 已删除的记录
+_DEAD_DIR = 0xFFFFFFFF
+
+
+class _IntMap:
+    """
+    开放寻址的 int => int 哈希表，键值都保存在array中，避免每个键值对一个Python对象
+    值必须为非负数且小于2^31
+    """
+    _EMPTY = -1
+    _DELETED = -2
+
+    def __init__(self, capacity: int = 16):
+        self.__reset(capacity)
+
+    def __reset(self, capacity: int):
+        self._bits = max(4, (capacity - 1).bit_length())
+        self._mask = (1 << self._bits) - 1
+        # 每个表使用不同的种子，按另一个表的顺序插入时不会聚集成长串
+        self._seed = random.getrandbits(64)
+        self._keys = array('Q', bytes(8 << self._bits))
+        self._values = array('i', [self._EMPTY]) * (1 << self._bits)
+        # 已占用的槽位，包括删除标记
+        self._used = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __slot(self, key: int) -> int:
+        # Fibonacci哈希，打散连续的inode
+        return (((key ^ self._seed) * 11400714819323198485) & _MASK64) >> (64 - self._bits)
+
+    def get(self, key: int) -> Optional[int]:
+        keys, values, mask = self._keys, self._values, self._mask
+        i = self.__slot(key)
+        while True:
+            value = values[i]
+            if value == self._EMPTY:
+                return None
+            if value >= 0 and keys[i] == key:
+                return value
+            i = (i + 1) & mask
+
+    def set(self, key: int, value: int):
+        if (self._used + 1) * 3 > (self._mask + 1) * 2:
+            self.__resize()
+        keys, values, mask = self._keys, self._values, self._mask
+        i = self.__slot(key)
+        free = -1
+        while True:
+            old = values[i]
+            if old == self._EMPTY:
+                break
+            if old == self._DELETED:
+                if free < 0:
+                    free = i
+            elif keys[i] == key:
+                values[i] = value
+                return
+            i = (i + 1) & mask
+        if free < 0:
+            free = i
+            self._used += 1
+        keys[free] = key
+        values[free] = value
+        self._size += 1
+
+    def delete(self, key: int):
+        keys, values, mask = self._keys, self._values, self._mask
+        i = self.__slot(key)
+        while True:
+            value = values[i]
+            if value == self._EMPTY:
+                return
+            if value >= 0 and keys[i] == key:
+                values[i] = self._DELETED
+                self._size -= 1
+                return
+            i = (i + 1) & mask
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        keys, values = self._keys, self._values
+        for i in range(len(values)):
+            if values[i] >= 0:
+                yield keys[i], values[i]
+
+    def __resize(self):
+        keys, values = self._keys, self._values
+        self.__reset(max(16, self._size * 2))
+        for i in range(len(values)):
+            if values[i] >= 0:
+                self.set(keys[i], values[i])
+
+
+class _EntryIndex:
+    """
+    开放寻址的哈希表，只保存32位的记录编号，不保存键
+    键由调用方从记录计算，查找时由调用方回到记录表确认是否匹配
+    """
+    _EMPTY = -1
+    _DELETED = -2
+
+    def __init__(self, key_of: Callable[[int], int], capacity: int = 16):
+        """
+        :param key_of: 计算记录的键，扩容时重新计算
+        """
+        self._key_of = key_of
+        self.__reset(capacity)
+
+    def __reset(self, capacity: int):
+        self._bits = max(4, (capacity - 1).bit_length())
+        self._mask = (1 << self._bits) - 1
+        self._slots = array('i', [self._EMPTY]) * (1 << self._bits)
+        self._used = 0
+        self._size = 0
+
+    def __slot(self, key: int) -> int:
+        return ((key * 11400714819323198485) & _MASK64) >> (64 - self._bits)
+
+    def find(self, key: int, match: Callable[[int], bool]) -> int:
+        """
+        :return: 键相同且match为真的记录，没有时返回-1
+        """
+        slots, mask = self._slots, self._mask
+        i = self.__slot(key)
+        while True:
+            entry = slots[i]
+            if entry == self._EMPTY:
+                return -1
+            if entry >= 0 and match(entry):
+                return entry
+            i = (i + 1) & mask
+
+    def add(self, key: int, entry: int):
+        if (self._used + 1) * 3 > (self._mask + 1) * 2:
+            self.__resize()
+        slots, mask = self._slots, self._mask
+        i = self.__slot(key)
+        while slots[i] >= 0:
+            i = (i + 1) & mask
+        if slots[i] == self._EMPTY:
+            self._used += 1
+        slots[i] = entry
+        self._size += 1
+
+    def remove(self, key: int, entry: int):
+        slots, mask = self._slots, self._mask
+        i = self.__slot(key)
+        while True:
+            value = slots[i]
+            if value == self._EMPTY:
+                return
+            if value == entry:
+                slots[i] = self._DELETED
+                self._size -= 1
+                return
+            i = (i + 1) & mask
+
+    def __resize(self):
+        entries = [entry for entry in self._slots if entry >= 0]
+        self.__reset(max(16, len(entries) * 2))
+        for entry in entries:
+            self.add(self._key_of(entry), entry)
+
+
+class InodeTable:
+    """
+    监控目录的inode记录表
+    目录路径只保存一份，文件保存为(目录编号, 文件名)，inode、链接数等按列保存在array中，
+    同一inode的文件串成链表，inode哈希表只保存链表头，路径索引只保存记录编号
+    """
+
+    def __init__(self):
+        # 目录路径
+        self._dirs: List[str] = []
+        self._dir_ids: Dict[str, int] = {}
+        # 每个文件一条记录
+        self._dir = array('I')
+        self._ino = array('Q')
+        self._nlink = array('I')
+        self._name_off = array('Q', [0])
+        self._names = bytearray()
+        self._ino_next = array('i')
+        # inode => 第一条记录
+        self._ino_map = _IntMap()
+        # (目录编号, 文件名) => 记录
+        self._path_index = _EntryIndex(self.__entry_key)
+        # 已删除的记录数
+        self._dead = 0
+
+    def __len__(self) -> int:
+        """
+        inode数量
+        """
+        return len(self._ino_map)
+
+    def __contains__(self, path: str) -> bool:
+        return self.inode_of(path) is not None
+
+    @property
+    def file_count(self) -> int:
+        """
+        文件数量
+        """
+        return len(self._dir) - self._dead
+
+    @staticmethod
+    def __path_key(dir_id: int, name: str) -> int:
+        return hash((dir_id, name)) & _MASK64
+
+    def __entry_key(self, entry: int) -> int:
+        return self.__path_key(self._dir[entry], self.__name(entry))
+
+    def __name(self, entry: int) -> str:
+        return self._names[self._name_off[entry]:self._name_off[entry + 1]].decode("utf-8", "surrogateescape")
+
+    def __path(self, entry: int) -> str:
+        return os.path.join(self._dirs[self._dir[entry]], self.__name(entry))
+
+    def __find(self, dir_id: int, name: str) -> int:
+        dirs, names, name_off = self._dir, self._names, self._name_off
+        raw = name.encode("utf-8", "surrogateescape")
+        return self._path_index.find(
+            self.__path_key(dir_id, name),
+            lambda entry: dirs[entry] == dir_id and names[name_off[entry]:name_off[entry + 1]] == raw)
+
+    def __entry_of(self, path: str) -> int:
+        dir_path, name = os.path.split(path)
+        dir_id = self._dir_ids.get(dir_path)
+        if dir_id is None:
+            return -1
+        return self.__find(dir_id, name)
+
+    def __chain(self, inode: int) -> Iterator[int]:
+        entry = self._ino_map.get(inode)
+        while entry is not None and entry >= 0:
+            yield entry
+            entry = self._ino_next[entry]
+
+    def __unlink(self, inode: int, entry: int):
+        """
+        从inode链表中移除记录
+        """
+        next_arr = self._ino_next
+        head = self._ino_map.get(inode)
+        if head == entry:
+            if next_arr[entry] >= 0:
+                self._ino_map.set(inode, next_arr[entry])
+            else:
+                self._ino_map.delete(inode)
+            return
+        prev = head
+        while prev is not None and prev >= 0:
+            if next_arr[prev] == entry:
+                next_arr[prev] = next_arr[entry]
+                return
+            prev = next_arr[prev]
+
+    def add_entry(self, dir_path: str, name: str, inode: int, nlink: int):
+        """
+        新增文件记录，路径已存在时更新
+        """
+        dir_id = self._dir_ids.get(dir_path)
+        if dir_id is None:
+            dir_id = len(self._dirs)
+            self._dirs.append(dir_path)
+            self._dir_ids[dir_path] = dir_id
+        entry = self.__find(dir_id, name)
+        if entry >= 0:
+            if self._ino[entry] == inode:
+                for link in self.__chain(inode):
+                    self._nlink[link] = nlink
+                return
+            self.__remove_entry(entry)
+        entry = len(self._dir)
+        self._dir.append(dir_id)
+        self._ino.append(inode)
+        self._nlink.append(nlink)
+        self._names += name.encode("utf-8", "surrogateescape")
+        self._name_off.append(len(self._names))
+        self._path_index.add(self.__path_key(dir_id, name), entry)
+        # 插入链表头
+        head = self._ino_map.get(inode)
+        self._ino_next.append(-1 if head is None else head)
+        self._ino_map.set(inode, entry)
+        # 同一inode的链接数保持一致
+        for link in self.__chain(inode):
+            self._nlink[link] = nlink
+
+    def add(self, path: str, inode: int, nlink: int):
+        """
+        新增文件记录
+        """
+        dir_path, name = os.path.split(path)
+        self.add_entry(dir_path, name, inode, nlink)
+
+    def __remove_entry(self, entry: int):
+        dir_id = self._dir[entry]
+        self._path_index.remove(self.__path_key(dir_id, self.__name(entry)), entry)
+        self.__unlink(self._ino[entry], entry)
+        self._dir[entry] = _DEAD_DIR
+        self._dead += 1
+
+    def remove(self, path: str) -> Optional[int]:
+        """
+        移除文件记录
+        :return: 文件的inode
+        """
+        entry = self.__entry_of(path)
+        if entry < 0:
+            return None
+        inode = self._ino[entry]
+        self.__remove_entry(entry)
+        self.__maybe_compact()
+        return inode
+
+    def inode_of(self, path: str) -> Optional[int]:
+        entry = self.__entry_of(path)
+        return self._ino[entry] if entry >= 0 else None
+
+    def nlink_of(self, inode: int) -> int:
+        entry = self._ino_map.get(inode)
+        return self._nlink[entry] if entry is not None else 0
+
+    def paths_of(self, inode: int) -> List[str]:
+        return [self.__path(entry) for entry in self.__chain(inode)]
+
+    def pop_inode(self, inode: int) -> List[str]:
+        """
+        移除inode的所有文件记录
+        :return: 文件路径
+        """
+        entries = list(self.__chain(inode))
+        paths = [self.__path(entry) for entry in entries]
+        for entry in entries:
+            self.__remove_entry(entry)
+        self.__maybe_compact()
+        return paths
+
+    def items(self) -> Iterator[Tuple[int, List[str], int]]:
+        """
+        遍历所有inode
+        :return: (inode, [文件路径], 链接数)
+        """
+        for inode, head in self._ino_map.items():
+            yield inode, self.paths_of(inode), self._nlink[head]
+
+    def miss_link_count(self) -> int:
+        """
+        未找完硬链接的inode数量
+        """
+        count = 0
+        for inode, head in self._ino_map.items():
+            links = sum(1 for _ in self.__chain(inode))
+            if links < self._nlink[head]:
+                count += 1
+        return count
+
+    def __maybe_compact(self):
+        """
+        删除的记录过多时重建
+        """
+        if self._dead < 1024 or self._dead * 2 < len(self._dir):
+            return
+        table = InodeTable()
+        for entry in range(len(self._dir)):
+            dir_id = self._dir[entry]
+            if dir_id == _DEAD_DIR:
+                continue
+            table.add_entry(self._dirs[dir_id], self.__name(entry), self._ino[entry], self._nlink[entry])
+        self.__dict__.update(table.__dict__)
+        # 索引扩容时从当前表计算键
+        self._path_index._key_of = self.__entry_key
@@ -1,10 +1,14 @@
 from typing import Any, List, Dict, Tuple, Optional, Union
 from pathlib import Path
+import hashlib
 import os
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import pytz
 
+from bencode import bdecode, bencode
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.schedulers.background import BackgroundScheduler
 from watchdog.events import FileSystemEventHandler
@@ -23,6 +27,15 @@ from app.utils.system import SystemUtils
 from app.schemas import ServiceInfo
 from app.helper.downloader import DownloaderHelper
 
+from plugins.uploadtorrent.rules import TorrentRouter
+
+# 目录事件停止多少秒后开始上传
+UPLOAD_DEBOUNCE = 3
+# 上传出错（连接、超时等）时的重试次数
+UPLOAD_RETRY = 2
+# 退出时最多等待正在进行的上传多少秒
+STOP_WAIT = 30
+
 
 class FileMonitorHandler(FileSystemEventHandler):
     """
@@ -35,10 +48,14 @@ class FileMonitorHandler(FileSystemEventHandler):
         self.sync = sync
 
     def on_created(self, event):
-        self.sync.upload_torrent([self._dir_conf])
+        if event.is_directory:
+            return
+        self.sync.schedule_upload(self._dir_conf, Path(event.src_path))
 
     def on_moved(self, event):
-        self.sync.upload_torrent([self._dir_conf])
+        if event.is_directory:
+            return
+        self.sync.schedule_upload(self._dir_conf, Path(event.dest_path))
 
 
 class UploadTorrent(_PluginBase):
@@ -49,7 +66,7 @@ class UploadTorrent(_PluginBase):
     # 插件图标
     plugin_icon = "upload.png"
     # 插件版本
-    plugin_version = "1.0.0"
+    plugin_version = "1.0.10"
     # 插件作者
     plugin_author = "hyuan280"
     # 作者主页
@@ -73,12 +90,23 @@ class UploadTorrent(_PluginBase):
     _monitor_type = None
     _cron = None
     _torrent_dirs = None
+    _upload_threads = 4
+    _route_rules = None
     site = None
     torrent_helper = None
     downloader_helper = None
 
     # 退出事件
     _event = threading.Event()
+    # 监控目录待上传的种子文件
+    _pending_files: Dict[str, set] = {}
+    # 监控目录的延时上传定时器
+    _pending_timers: Dict[str, threading.Timer] = {}
+    # 每个目录同时只有一个上传任务
+    _dir_locks: Dict[str, threading.RLock] = {}
+    _pending_lock = threading.Lock()
+    # 每个下载器同时上传的种子数
+    _downloader_limits: Dict[str, Tuple[int, threading.Semaphore]] = {}
 
     def init_plugin(self, config: dict = None):
         self.downloader_helper = DownloaderHelper()
@@ -94,6 +122,11 @@ class UploadTorrent(_PluginBase):
             self._cron = config.get("cron")
             self._torrent_dirs = config.get("torrent_dirs")
             self._downloader = config.get("downloader")
+            self._route_rules = config.get("route_rules")
+            try:
+                self._upload_threads = max(1, int(config.get("upload_threads") or 4))
+            except ValueError:
+                self._upload_threads = 4
 
         if self.get_state() or self._onlyonce:
             # 定时服务
@@ -149,6 +182,8 @@ class UploadTorrent(_PluginBase):
                 "cron": self._cron,
                 "torrent_dirs": self._torrent_dirs,
                 "downloader": self._downloader,
+                "upload_threads": self._upload_threads,
+                "route_rules": self._route_rules,
             })
 
             # 启动服务
@@ -163,48 +198,268 @@ class UploadTorrent(_PluginBase):
                 return True
         return False
 
-    def __upload_torrent(self, torrent_path: str, save_path: str):
+    def __downloader_limit(self, name: str) -> threading.Semaphore:
+        """
+        下载器的上传并发限制，多个目录、多次运行共用
+        """
+        with self._pending_lock:
+            size, limit = self._downloader_limits.get(name) or (0, None)
+            if size != self._upload_threads:
+                limit = threading.Semaphore(self._upload_threads)
+                self._downloader_limits[name] = (self._upload_threads, limit)
+            return limit
+
+    @staticmethod
+    def __move_to(file_path: Path, folder: str):
+        """
+        移动种子文件到子目录
+        """
+        target_path = file_path.absolute().parent / folder
+        os.makedirs(target_path, exist_ok=True)
+        file_path.rename(target_path / file_path.name)
+
+    @staticmethod
+    def __decode(content: bytes) -> Optional[dict]:
+        """
+        解码种子文件
+        :return: 解码后的种子，失败返回None
+        """
+        try:
+            torrent = bdecode(content)
+            return torrent if isinstance(torrent, dict) and isinstance(torrent.get("info"), dict) else None
+        except Exception as e:
+            logger.warn(f"解析种子文件失败：{str(e)}")
+            return None
+
+    def __downloader_hashes(self, service: ServiceInfo) -> Optional[set]:
+        """
+        一次获取下载器中所有种子的hash
+        :return: 小写的hash集合，获取失败返回None
+        """
+        torrents, error = service.instance.get_torrents()
+        if error:
+            logger.warn(f"获取下载器 {service.name} 种子列表失败，不检查重复种子")
+            return None
+        if self.downloader_helper.is_downloader("qbittorrent", service=service):
+            return {str(torrent.get("hash")).lower() for torrent in torrents}
+        return {str(torrent.hashString).lower() for torrent in torrents}
+
+    def __upload_one(self, downloader: Union[Qbittorrent, Transmission], is_qbittorrent: bool,
+                     limit: threading.Semaphore, file_path: Path, save_path: str,
+                     known_hashes: Optional[set], uploading: Dict[str, threading.Event],
+                     hash_lock: threading.Lock, router: Optional[TorrentRouter]) -> Tuple[str, int]:
+        """
+        上传一个种子文件，下载器中已有的种子不上传，出错时重试
+        :return: 结果 success/failed/duplicate/stopped，种子大小
+        """
+        if self._event.is_set():
+            # 插件停止时还没开始的种子留在原处，下次启动再上传
+            return "stopped", 0
+        torrent_content = file_path.read_bytes()
+        logger.info(f"找到种子文件：{str(file_path)}, 大小：{len(torrent_content)}")
+        torrent_info = self.__decode(torrent_content) if known_hashes is not None or router else None
+        info_hash = None
+        if torrent_info and known_hashes is not None:
+            info_hash = hashlib.sha1(bencode(torrent_info["info"])).hexdigest()
+            if not self.__claim_hash(info_hash, known_hashes, uploading, hash_lock):
+                logger.info(f"种子 {file_path.name} 已在下载器中，hash：{info_hash}")
+                self.__move_to(file_path, "duplicate")
+                return "duplicate", len(torrent_content)
+        torrent = None
+        try:
+            torrent = self.__add_torrent(downloader, is_qbittorrent, limit, file_path, torrent_content,
+                                         save_path, torrent_info, router)
+        finally:
+            if info_hash:
+                with hash_lock:
+                    if torrent:
+                        known_hashes.add(info_hash)
+                    uploading.pop(info_hash).set()
+        if not torrent and self._event.is_set():
+            # 停止插件中断的上传不算失败，留在原处下次启动再上传
+            logger.info(f"插件停止，种子 {file_path.name} 未上传")
+            return "stopped", len(torrent_content)
+        self.__move_to(file_path, "success" if torrent else "failed")
+        return "success" if torrent else "failed", len(torrent_content)
+
+    @staticmethod
+    def __claim_hash(info_hash: str, known_hashes: set, uploading: Dict[str, threading.Event],
+                     hash_lock: threading.Lock) -> bool:
+        """
+        占用种子hash，同一批中重复的种子等前一个上传结束后再判断，前一个上传失败时由后一个上传
+        :return: 是否需要上传，下载器中已有时返回False
+        """
+        while True:
+            with hash_lock:
+                if info_hash in known_hashes:
+                    return False
+                waiting = uploading.get(info_hash)
+                if not waiting:
+                    uploading[info_hash] = threading.Event()
+                    return True
+            waiting.wait()
+
+    def __add_torrent(self, downloader: Union[Qbittorrent, Transmission], is_qbittorrent: bool,
+                      limit: threading.Semaphore, file_path: Path, torrent_content: bytes, save_path: str,
+                      torrent_info: Optional[dict], router: Optional[TorrentRouter]) -> Any:
+        """
+        按分流规则添加种子到下载器，出错时重试
+        :return: 下载器返回的结果，失败时为空
+        """
+        is_paused, tags, category = self._is_paused, None, None
+        rule = router.route(torrent_info) if router and torrent_info else None
+        if rule:
+            logger.info(f"种子 {file_path.name} 匹配分流规则：{rule.line}")
+            save_path = rule.save_path or save_path
+            is_paused = self._is_paused if rule.is_paused is None else rule.is_paused
+            tags, category = rule.tags, rule.category
+        if is_qbittorrent:
+            extra_args = {"tag": tags, "category": category}
+        else:
+            # Transmission没有分类，只设置标签
+            extra_args = {"labels": tags}
+        torrent = None
+        for retry in range(UPLOAD_RETRY + 1):
+            if retry:
+                logger.warn(f"上传种子文件 {file_path.name} 失败，{retry}秒后第{retry}次重试")
+                if self._event.wait(retry):
+                    break
+            elif self._event.is_set():
+                break
+            try:
+                with limit:
+                    torrent = downloader.add_torrent(torrent_content, is_paused, save_path, **extra_args)
+            except Exception as e:
+                # 连接、超时等错误才重试
+                logger.error(f"上传种子文件 {file_path.name} 出错：{str(e)}")
+                torrent = None
+                continue
+            # 下载器拒绝（种子错误、已存在等）时重试也不会成功
+            break
+        return torrent
+
+    def __upload_torrent(self, torrent_path: str, save_path: str, files: List[Path] = None,
+                         known_hashes: Optional[set] = None, router: Optional[TorrentRouter] = None):
         """
         处理上传种子文件到下载器
+        :param files: 只上传这些种子文件，为空时上传目录下所有种子文件
+        :param known_hashes: 下载器中已有种子的hash，为None时不检查重复
+        :param router: 分流规则，匹配的种子使用规则中的保存路径
         """
         service = self.service_info(self._downloader)
         downloader: Optional[Union[Qbittorrent, Transmission]] = service.instance if service else None
         if not downloader:
             return True, f"未找到下载器 {self._downloader}"
 
-        success_cnt = 0
-        failed_cnt = 0
-
-        for file_path in SystemUtils.list_files(Path(torrent_path), ".torrent", recursive=False):
-            if file_path.is_file():
-                if not self.__check_file_permissions_rw(file_path):
-                    return True, f"没有权限读写种子文件：{str(file_path)}"
-                torrent_content = file_path.read_bytes()
-                logger.info(f"找到种子文件：{str(file_path)}, 大小：{len(torrent_content)}")
-                torrent = downloader.add_torrent(torrent_content, self._is_paused, save_path)
-                if torrent:
-                    success_cnt += 1
-                    success_path = str(file_path.absolute().parent)+"/success/"
-                    if not os.path.exists(success_path):
-                        os.mkdir(success_path)
-                    file_path.rename(success_path+file_path.name)
-                else:
-                    failed_cnt += 1
-                    failed_path = str(file_path.absolute().parent)+"/failed/"
-                    if not os.path.exists(failed_path):
-                        os.mkdir(failed_path)
-                    file_path.rename(failed_path+file_path.name)
-
-        if success_cnt+failed_cnt == 0:
+        counts = {"success": 0, "failed": 0, "duplicate": 0, "stopped": 0}
+        total_size = 0
+        error_msg = None
+        start_time = time.time()
+        hash_lock = threading.Lock()
+        # 正在上传的种子hash => 上传结束事件
+        uploading: Dict[str, threading.Event] = {}
+
+        if files is None:
+            files = SystemUtils.list_files(Path(torrent_path), ".torrent", recursive=False)
+        limit = self.__downloader_limit(self._downloader)
+        is_qbittorrent = self.downloader_helper.is_downloader("qbittorrent", service=service)
+        with ThreadPoolExecutor(max_workers=self._upload_threads) as executor:
+            futures = []
+            for file_path in files:
+                if self._event.is_set():
+                    break
+                if file_path.is_file():
+                    if not self.__check_file_permissions_rw(file_path):
+                        error_msg = f"没有权限读写种子文件：{str(file_path)}"
+                        break
+                    futures.append(executor.submit(self.__upload_one, downloader, is_qbittorrent, limit,
+                                                   file_path, save_path, known_hashes, uploading, hash_lock, router))
+            for future in futures:
+                try:
+                    result, size = future.result()
+                except Exception as e:
+                    logger.error(f"上传种子文件出错：{str(e)}")
+                    counts["failed"] += 1
+                    continue
+                total_size += size
+                counts[result] += 1
+
+        total_cnt = sum(counts.values())
+        elapsed = time.time() - start_time
+        stats = f"耗时 {elapsed:.1f} 秒，{total_cnt / elapsed if elapsed else 0:.1f} 个/秒，" \
+                f"共 {total_size / 1024 / 1024:.2f} MB"
+        if total_cnt:
+            logger.info(f"路径 {torrent_path} 处理 {total_cnt} 个种子，{stats}")
+        if error_msg:
+            return True, error_msg
+        if total_cnt == 0:
             return False, f"路径 {torrent_path} 没有找到种子文件"
         else:
-            return False, f"""路径 {torrent_path} 有 {success_cnt+failed_cnt} 个种子：
-  成功 {success_cnt} 个
-  失败 {failed_cnt} 个"""
+            lines = [f"路径 {torrent_path} 有 {total_cnt} 个种子：",
+                     f"  成功 {counts['success']} 个",
+                     f"  失败 {counts['failed']} 个",
+                     f"  重复 {counts['duplicate']} 个"]
+            if counts["stopped"]:
+                lines.append(f"  停止时未上传 {counts['stopped']} 个")
+            lines.append(f"  {stats}")
+            return False, "\n".join(lines)
+
+    def schedule_upload(self, dir_conf: str, file_path: Path):
+        """
+        监控目录有新的种子文件，等待目录事件停止后只上传新增的文件
+        """
+        monitor_dir = dir_conf.split(":")[0]
+        if file_path.suffix.lower() != ".torrent" or file_path.parent != Path(monitor_dir):
+            return
+        with self._pending_lock:
+            self._pending_files.setdefault(dir_conf, set()).add(file_path)
+            self.__restart_timer(dir_conf)
+
+    def __restart_timer(self, dir_conf: str):
+        """
+        重新开始计时，调用前需持有_pending_lock
+        """
+        timer = self._pending_timers.get(dir_conf)
+        if timer:
+            timer.cancel()
+        timer = threading.Timer(UPLOAD_DEBOUNCE, self.__flush_pending, args=(dir_conf,))
+        timer.daemon = True
+        self._pending_timers[dir_conf] = timer
+        timer.start()
+
+    def __dir_lock(self, dir_conf: str) -> threading.RLock:
+        """
+        目录的上传锁
+        """
+        with self._pending_lock:
+            return self._dir_locks.setdefault(dir_conf, threading.RLock())
 
-    def upload_torrent(self, torrent_dirs: list = None):
+    def __flush_pending(self, dir_conf: str):
+        """
+        上传监控目录新增的种子文件
+        """
+        dir_lock = self.__dir_lock(dir_conf)
+        if not dir_lock.acquire(blocking=False):
+            # 目录正在上传，稍后再处理新增的文件
+            with self._pending_lock:
+                if self._pending_timers.get(dir_conf) and not self._event.is_set():
+                    self.__restart_timer(dir_conf)
+            return
+        try:
+            with self._pending_lock:
+                self._pending_timers.pop(dir_conf, None)
+                files = self._pending_files.pop(dir_conf, set())
+            if not files or self._event.is_set():
+                return
+            logger.info(f"{dir_conf.split(':')[0]} 新增 {len(files)} 个种子文件")
+            self.upload_torrent([dir_conf], files=sorted(files))
+        finally:
+            dir_lock.release()
+
+    def upload_torrent(self, torrent_dirs: list = None, files: List[Path] = None):
         """
         上传种子文件
+        :param files: 只上传这些种子文件
         :return 有无错误，结果信息
         """
         logger.info("准备上传种子文件 ...")
@@ -214,12 +469,18 @@ class UploadTorrent(_PluginBase):
         else:
             _torrent_dirs = str(self._torrent_dirs).split("\n")
         try:
+            # 每次运行只获取一次下载器的种子列表
+            service = self.service_info(self._downloader)
+            known_hashes = self.__downloader_hashes(service) if service else None
+            # 分流规则每次运行编译一次
+            router = TorrentRouter(self._route_rules)
             for torrent_dir in _torrent_dirs:
                 if torrent_dir.startswith("#"):
                     continue
                 try:
                     file_path, save_path = torrent_dir.split(":")
-                    error, result = self.__upload_torrent(file_path, save_path)
+                    with self.__dir_lock(torrent_dir):
+                        error, result = self.__upload_torrent(file_path, save_path, files, known_hashes, router)
                     all_result += f"{result}\n"
                     if error:
                         logger.error("上传种子文件失败")
@@ -420,7 +681,7 @@ class UploadTorrent(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
                                 },
                                 'content': [
                                     {
@@ -437,7 +698,24 @@ class UploadTorrent(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'upload_threads',
+                                            'label': '同时上传数',
+                                            'placeholder': '4'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
                                 },
                                 'content': [
                                     {
@@ -519,6 +797,29 @@ class UploadTorrent(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextarea',
+                                        'props': {
+                                            'model': 'route_rules',
+                                            'rows': '3',
+                                            'label': '分流规则',
+                                            'placeholder': '一行一条，格式 "条件;条件|动作;动作"，按顺序使用第一条匹配的规则\n'
+                                                           '例：tracker=example.com;size>10G|path=/downloads/movie;category=movie;tags=a,b;paused=false'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -549,7 +850,7 @@ class UploadTorrent(_PluginBase):
                                         'props': {
                                             'type': 'info',
                                             'variant': 'tonal',
-                                            'text': '一行开头写"#"代表注释这一行的配置，不递归查找子目录，上传失败的种子会移动到failed目录下，成功的会移动到success目录下'
+                                            'text': '一行开头写"#"代表注释这一行的配置，不递归查找子目录，上传失败的种子会移动到failed目录下，成功的会移动到success目录下，下载器中已有的种子会移动到duplicate目录下'
                                         }
                                     }
                                 ]
@@ -569,6 +870,22 @@ class UploadTorrent(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VAlert',
+                                        'props': {
+                                            'type': 'info',
+                                            'variant': 'tonal',
+                                            'text': '分流规则条件：tracker=域名、name=名称正则、size>=大小(如10G)、files<=文件数，值中有;或|时用双引号括起来，如 name="S01;E0[1-9]"；动作：path=保存路径、category=分类(仅qBittorrent)、tags=标签1,标签2、paused=true/false；没有匹配的种子使用目录配置的保存路径'
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     }
@@ -583,7 +900,9 @@ class UploadTorrent(_PluginBase):
             "run_mothod": "cron",
             "monitor_type": "fast",
             "cron": "",
-            "torrent_dirs": ""
+            "torrent_dirs": "",
+            "upload_threads": 4,
+            "route_rules": ""
         }
 
     def get_page(self) -> List[dict]:
@@ -593,6 +912,8 @@ class UploadTorrent(_PluginBase):
         """
         退出插件
         """
+        # 通知正在进行的上传停止，只有目录监控时也没有调度器
+        self._event.set()
         if self._observer:
             for observer in self._observer:
                 try:
@@ -602,13 +923,26 @@ class UploadTorrent(_PluginBase):
                     print(str(e))
             self._observer = []
 
+        with self._pending_lock:
+            for timer in self._pending_timers.values():
+                timer.cancel()
+            self._pending_timers = {}
+            self._pending_files = {}
+            dir_locks = list(self._dir_locks.values())
+
         if self._scheduler:
             try:
                 self._scheduler.remove_all_jobs()
                 if self._scheduler.running:
-                    self._event.set()
                     self._scheduler.shutdown()
-                    self._event.clear()
             except Exception as e:
                 print(str(e))
             self._scheduler = None
+
+        # 等待已经开始的目录上传结束
+        for dir_lock in dir_locks:
+            if dir_lock.acquire(timeout=STOP_WAIT):
+                dir_lock.release()
+            else:
+                logger.warn("等待种子上传结束超时")
+        self._event.clear()
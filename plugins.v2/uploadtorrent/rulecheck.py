@@ -0,0 +1,58 @@
+"""
+分流规则解析检查
+在MoviePilot目录中运行：python -m plugins.uploadtorrent.rulecheck
+"""
+from plugins.uploadtorrent.rules import RouteRule, TorrentMeta, TorrentRouter
+
+
+def _torrent(name: str, size: int = 1024 ** 3, tracker: str = "https://tracker.example.com/announce") -> dict:
+    return {"announce": tracker, "info": {"name": name, "length": size}}
+
+
+def _invalid(line: str) -> str:
+    try:
+        RouteRule(line)
+    except ValueError as e:
+        return str(e)
+    raise AssertionError(f"规则应当无效：{line}")
+
+
+def check_rules() -> int:
+    """
+    检查名称正则中的;和|、双引号和无效规则的解析
+    :return: 检查的规则数，不符合预期时抛出AssertionError
+    """
+    checked = 0
+    # 双引号中的;和|属于正则
+    rule = RouteRule('name="S01;E0[1-9]";size>=1G|path="/data/tv;s01"')
+    assert rule.save_path == "/data/tv;s01", rule.save_path
+    assert rule.match(TorrentMeta(_torrent("Show.S01;E05.1080p")))
+    assert not rule.match(TorrentMeta(_torrent("Show.S01E05.1080p")))
+    assert not rule.match(TorrentMeta(_torrent("Show.S01;E05.1080p", size=1024)))
+    checked += 1
+    rule = RouteRule('name="S01|S02"|path=/data/tv')
+    assert rule.match(TorrentMeta(_torrent("Show.S02E01")))
+    assert not rule.match(TorrentMeta(_torrent("Show.S03E01")))
+    checked += 1
+    # 不加引号时以最后一个|分隔动作
+    rule = RouteRule("name=S01|S02|path=/data/tv")
+    assert rule.save_path == "/data/tv" and rule.match(TorrentMeta(_torrent("Show.S02E01")))
+    checked += 1
+    # 不加引号的;会拆出无效条件，需要报错而不是静默生效
+    message = _invalid("name=S01;E0[1-9]|path=/data/tv")
+    assert "E0[1-9]" in message and "双引号" in message, message
+    checked += 1
+    assert "双引号" in _invalid('name="S01;E0[1-9]|path=/data/tv')
+    checked += 1
+    assert "|" in _invalid("name=S01")
+    checked += 1
+    # 无效规则被跳过，其余规则照常使用
+    router = TorrentRouter("name=S01;E0[1-9]|path=/a\n# 注释\ntracker=example.com|path=/b")
+    assert [rule.save_path for rule in router.rules] == ["/b"]
+    assert router.route(_torrent("Show.S01;E05")).save_path == "/b"
+    checked += 1
+    return checked
+
+
+if __name__ == "__main__":
+    print(f"{check_rules()}条分流规则解析结果符合预期")
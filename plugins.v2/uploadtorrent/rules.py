@@ -0,0 +1,179 @@
+"""
+种子分流规则
+"""
+import operator
+import re
+from typing import Any, Callable, List, Optional
+from urllib.parse import urlparse
+
+from app.log import logger
+
+_SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+_COMPARE_OPS = {">=": operator.ge, "<=": operator.le, ">": operator.gt, "<": operator.lt, "=": operator.eq}
+_CONDITION_RE = re.compile(r"^\s*(tracker|name|size|files)\s*(>=|<=|>|<|=)\s*(.+?)\s*$", re.IGNORECASE)
+_SIZE_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([BKMGT]?)B?$", re.IGNORECASE)
+
+
+def _to_str(value: Any) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "ignore")
+    return str(value) if value is not None else ""
+
+
+def _split_unquoted(text: str, sep: str) -> List[str]:
+    """
+    按不在双引号中的分隔符拆分，引号保留
+    """
+    parts = []
+    current = []
+    quoted = False
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        if char == sep and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    if quoted:
+        raise ValueError("双引号不成对")
+    parts.append("".join(current))
+    return parts
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def _parse_size(text: str) -> int:
+    match = _SIZE_RE.match(text.strip())
+    if not match:
+        raise ValueError(f"大小格式错误：{text}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+class TorrentMeta:
+    """
+    规则匹配用到的种子信息
+    """
+
+    def __init__(self, torrent: dict):
+        info = torrent.get("info") or {}
+        self.name = _to_str(info.get("name"))
+        files = info.get("files")
+        if files:
+            self.size = sum(int(file.get("length") or 0) for file in files)
+            self.file_count = len(files)
+        else:
+            self.size = int(info.get("length") or 0)
+            self.file_count = 1
+        urls = [torrent.get("announce")]
+        for tier in torrent.get("announce-list") or []:
+            urls.extend(tier if isinstance(tier, list) else [tier])
+        self.trackers = set()
+        for url in urls:
+            host = urlparse(_to_str(url)).hostname
+            if host:
+                self.trackers.add(host.lower())
+
+
+class RouteRule:
+    """
+    一条分流规则：条件都满足时使用规则中的保存路径、分类、标签和暂停状态
+    """
+
+    def __init__(self, line: str):
+        """
+        :param line: 格式 "条件;条件|动作;动作"，值中有;或|时用双引号括起来，如 name="S01;E0[1-9]"
+        """
+        parts = _split_unquoted(line, "|")
+        if len(parts) < 2:
+            raise ValueError("条件和动作之间需要用|分隔")
+        # 名称正则中可能有|，以最后一个|分隔
+        conditions, actions = "|".join(parts[:-1]), parts[-1]
+        self.line = line
+        self._conditions: List[Callable[[TorrentMeta], bool]] = [
+            self.__compile_condition(condition) for condition in _split_unquoted(conditions, ";")
+            if condition.strip()
+        ]
+        self.save_path: Optional[str] = None
+        self.category: Optional[str] = None
+        self.tags: Optional[List[str]] = None
+        self.is_paused: Optional[bool] = None
+        for action in _split_unquoted(actions, ";"):
+            if not action.strip():
+                continue
+            key, _, value = action.partition("=")
+            key, value = key.strip().lower(), _unquote(value.strip())
+            if key == "path":
+                self.save_path = value
+            elif key == "category":
+                self.category = value
+            elif key == "tags":
+                self.tags = [tag.strip() for tag in value.split(",") if tag.strip()]
+            elif key == "paused":
+                self.is_paused = value.lower() in ("true", "yes", "1", "是")
+            else:
+                raise ValueError(f"未知的动作：{action.strip()}")
+
+    @staticmethod
+    def __compile_condition(condition: str) -> Callable[[TorrentMeta], bool]:
+        """
+        编译条件
+        """
+        match = _CONDITION_RE.match(condition)
+        if not match:
+            raise ValueError(f"条件格式错误：{condition.strip()}，值中有;或|时需要用双引号括起来")
+        key, op, value = match.group(1).lower(), match.group(2), _unquote(match.group(3))
+        if key in ("tracker", "name") and op != "=":
+            raise ValueError(f"{key} 只支持 = 条件：{condition.strip()}")
+        if key == "tracker":
+            domain = value.lower()
+            # 匹配域名及其子域名
+            return lambda meta: any(host == domain or host.endswith("." + domain) for host in meta.trackers)
+        if key == "name":
+            pattern = re.compile(value, re.IGNORECASE)
+            return lambda meta: bool(pattern.search(meta.name))
+        compare = _COMPARE_OPS[op]
+        if key == "size":
+            size = _parse_size(value)
+            return lambda meta: compare(meta.size, size)
+        count = int(value)
+        return lambda meta: compare(meta.file_count, count)
+
+    def match(self, meta: TorrentMeta) -> bool:
+        return all(condition(meta) for condition in self._conditions)
+
+
+class TorrentRouter:
+    """
+    按顺序匹配分流规则，每次运行编译一次
+    """
+
+    def __init__(self, config: str):
+        self.rules: List[RouteRule] = []
+        for line in (config or "").split("\n"):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                self.rules.append(RouteRule(line))
+            except (ValueError, re.error) as e:
+                logger.warn(f"分流规则 {line} 无效：{str(e)}")
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def route(self, torrent: dict) -> Optional[RouteRule]:
+        """
+        查找第一条匹配的规则
+        :param torrent: 解码后的种子
+        :return: 匹配的规则，没有匹配返回None
+        """
+        meta = TorrentMeta(torrent)
+        for rule in self.rules:
+            if rule.match(meta):
+                return rule
+        return None